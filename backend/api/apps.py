@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SimpleAdminConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,76 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from recipes.models import Product
+from .cache import get_version, product_catalogue
+from .serializers import ProductSerializer
+
+
+def normalize_name(name):
+    """Return product name or query in form used for index keys."""
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def serialize_catalogue():
+    """Return all products serialized by ProductSerializer."""
+    serializer = ProductSerializer(Product.objects.all(), many=True)
+    return [dict(item) for item in serializer.data]
+
+
+class ProductIndex:
+    """Sorted in-memory index of Product.name for autocomplete.
+
+    Built from the cached serialized catalogue and rebuilt as soon as
+    the catalogue version changes (Product post_save/post_delete).
+    Search returns serialized products: names starting with the query
+    first, then names containing it, both in alphabetical order.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._keys = []
+        self._items = []
+        self._lock = Lock()
+
+    def build(self):
+        """Load catalogue and rebuild index if catalogue was changed."""
+        version = get_version(product_catalogue.namespace)
+        if version == self.version:
+            return
+        _, catalogue = product_catalogue.get_or_build('', serialize_catalogue)
+        entries = sorted(
+            (normalize_name(item['name']), item['id'], item)
+            for item in catalogue
+        )
+        with self._lock:
+            self._keys = [key for key, _, _ in entries]
+            self._items = [item for _, _, item in entries]
+            self.version = version
+
+    def search(self, query, limit=None):
+        """Return up to limit products matching query."""
+        self.build()
+        query = normalize_name(query)
+        limit = limit or settings.INGREDIENTS_SEARCH_LIMIT
+        with self._lock:
+            keys, items = self._keys, self._items
+
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit and (
+            keys[end].startswith(query)
+        ):
+            end += 1
+        result = items[start:end]
+        if len(result) < limit:
+            for key, item in zip(keys, items):
+                if query in key and not key.startswith(query):
+                    result.append(item)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+product_index = ProductIndex()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+from collections import OrderedDict
+from itertools import chain
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+VERSION_KEY = '{}:version'
+
+
+def get_version(namespace):
+    """Return current version token of cached namespace.
+
+    Token is random, so an evicted version key never brings back
+    entries stored under an old version.
+    """
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate all entries of namespace in every process."""
+    cache.set(VERSION_KEY.format(namespace), uuid4().hex, timeout=None)
+
+
+def get_versions(namespaces):
+    """Return {namespace: version token} in two cache round trips."""
+    keys = {
+        namespace: VERSION_KEY.format(namespace) for namespace in namespaces
+    }
+    versions = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid4().hex, timeout=None)
+        versions.update(cache.get_many(missing))
+    return {
+        namespace: versions.get(key) for namespace, key in keys.items()
+    }
+
+
+def bump_versions(namespaces):
+    """Invalidate entries of all namespaces at once."""
+    if namespaces:
+        cache.set_many(
+            {
+                VERSION_KEY.format(namespace): uuid4().hex
+                for namespace in namespaces
+            },
+            timeout=None,
+        )
+
+
+def make_etag(data):
+    """Return quoted ETag of json-serializable data."""
+    content = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return '"{}"'.format(hashlib.md5(content.encode()).hexdigest())
+
+
+class VersionedCache:
+    """Two-level cache of serialized data: in-process LRU + shared cache.
+
+    Entries are (etag, data) pairs keyed by namespace version, so
+    bump_version(namespace) drops them all at once. The local level is
+    cleared as soon as the process sees a new version. Shared entries
+    of old versions are removed by the cache backend after timeout.
+    """
+
+    def __init__(self, namespace, timeout=None, max_local_entries=1024):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.max_local_entries = max_local_entries
+        self._version = None
+        self._local = OrderedDict()
+        self._lock = Lock()
+
+    def _shared_key(self, version, key):
+        digest = hashlib.md5(key.encode()).hexdigest()
+        return f'{self.namespace}:{version}:{digest}'
+
+    def get_or_build(self, key, builder, shared=True):
+        """Return (etag, data) for key, calling builder() on a miss.
+
+        With shared=False the entry is kept only in the bounded local
+        level, for keys taken from arbitrary client input.
+        """
+        version = get_version(self.namespace)
+        with self._lock:
+            if version != self._version:
+                self._local.clear()
+                self._version = version
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+                return entry
+
+        shared_key = self._shared_key(version, key)
+        entry = cache.get(shared_key) if shared else None
+        if entry is None:
+            data = builder()
+            entry = (make_etag(data), data)
+            if shared:
+                cache.set(shared_key, entry, timeout=self.timeout)
+
+        with self._lock:
+            if version == self._version:
+                self._local[key] = entry
+                while len(self._local) > self.max_local_entries:
+                    self._local.popitem(last=False)
+        return entry
+
+
+class TaggedCache:
+    """Shared cache of serialized data invalidated by tags.
+
+    An entry keeps version tokens of its tags as they were before the
+    data was read, bump_versions(tags) makes all entries with any of
+    them stale. Tags known only from the built data (e.g. ids of
+    recipes on a page) are read after building, so a write committed
+    during building may be missed until timeout.
+    """
+
+    def __init__(self, prefix, timeout=None):
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def _shared_key(self, key):
+        return f'{self.prefix}:{hashlib.md5(key.encode()).hexdigest()}'
+
+    def get_many(self, keys):
+        """Return {key: value} of entries with current versions of tags."""
+        shared_keys = {self._shared_key(key): key for key in keys}
+        entries = cache.get_many(shared_keys)
+        if not entries:
+            return {}
+        current = get_versions(set(chain.from_iterable(
+            versions for _, versions in entries.values()
+        )))
+        return {
+            shared_keys[shared_key]: value
+            for shared_key, (value, versions) in entries.items()
+            if all(current[tag] == version
+                   for tag, version in versions.items())
+        }
+
+    def set_many(self, entries):
+        """Store {key: (value, versions of its tags)}.
+
+        Versions must be read before the data of value.
+        """
+        cache.set_many(
+            {self._shared_key(key): entry for key, entry in entries.items()},
+            timeout=self.timeout,
+        )
+
+    def get_or_build(self, key, get_tags, builder):
+        """Return (etag, data) for key, calling builder() on a miss.
+
+        get_tags() returns tags known before building, builder() returns
+        (data, tags of data).
+        """
+        value = self.get_many((key,)).get(key)
+        if value is None:
+            versions = get_versions(get_tags())
+            data, data_tags = builder()
+            versions.update(get_versions(set(data_tags) - versions.keys()))
+            value = (make_etag(data), data)
+            self.set_many({key: (value, versions)})
+        return value
+
+
+product_catalogue = VersionedCache(
+    'ingredients',
+    timeout=settings.INGREDIENTS_CACHE_TIMEOUT,
+    max_local_entries=settings.INGREDIENTS_CACHE_MAX_LOCAL_ENTRIES,
+)
@@ -0,0 +1,106 @@
+import csv
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+TITLE = 'Список продуктов к покупке'
+CSV_HEADER = ('Продукт', 'Количество', 'Единица измерения')
+CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object which returns written value instead of storing."""
+
+    def write(self, value):
+        return value
+
+
+class TextExporter:
+    """Shopping list as plain text, one product per line."""
+    format = 'txt'
+    media_type = 'text/plain; charset=utf-8'
+
+    def stream(self, rows):
+        yield f'{TITLE}\r\n\r\n'.encode()
+        for row in rows:
+            yield (
+                f'* {row["name"]} - {row["amount"]} '
+                f'{row["measurement_unit"]} \r\n'
+            ).encode()
+
+
+class CSVExporter:
+    """Shopping list as CSV with header, BOM makes Excel detect UTF-8."""
+    format = 'csv'
+    media_type = 'text/csv; charset=utf-8'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield '\ufeff'.encode()
+        yield writer.writerow(CSV_HEADER).encode()
+        for row in rows:
+            yield writer.writerow(
+                (row['name'], row['amount'], row['measurement_unit'])
+            ).encode()
+
+
+class PDFExporter:
+    """Shopping list as A4 PDF.
+
+    Pages are drawn while rows are read and spooled to a temporary file,
+    which is streamed by chunks afterwards: reportlab can't emit a
+    document before it's finished.
+    """
+    format = 'pdf'
+    media_type = 'application/pdf'
+    font_size = 12
+    line_height = 7 * mm
+    margin = 20 * mm
+
+    def get_font(self):
+        """Register TTF with cyrillic glyphs, fall back to Helvetica."""
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            return 'Helvetica'
+        font_name = os.path.splitext(os.path.basename(font_path))[0]
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(font_name, font_path))
+        return font_name
+
+    def stream(self, rows):
+        font = self.get_font()
+        _, height = A4
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE) as pdf_file:
+            page = canvas.Canvas(pdf_file, pagesize=A4)
+            page.setTitle(TITLE)
+            page.setFont(font, self.font_size + 4)
+            page.drawString(self.margin, height - self.margin, TITLE)
+            page.setFont(font, self.font_size)
+            y = height - self.margin - 2 * self.line_height
+            for row in rows:
+                if y < self.margin:
+                    page.showPage()
+                    page.setFont(font, self.font_size)
+                    y = height - self.margin
+                page.drawString(
+                    self.margin, y,
+                    f'• {row["name"]} - {row["amount"]} '
+                    f'{row["measurement_unit"]}'
+                )
+                y -= self.line_height
+            page.save()
+            pdf_file.seek(0)
+            for chunk in iter(lambda: pdf_file.read(CHUNK_SIZE), b''):
+                yield chunk
+
+
+SHOPPING_LIST_EXPORTERS = {
+    exporter.format: exporter
+    for exporter in (TextExporter(), CSVExporter(), PDFExporter())
+}
@@ -1,7 +1,9 @@
+from django.db.models import F
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe
+from recipes.search import search_recipes
 from users.models import CustomUser as User
 
 
@@ -17,6 +19,10 @@ class RecipeQueryParamFilter(FilterSet):
     'is_in_shopping_cart'   boolean
     'author'                Recipe.author field
     'tags'                  Recipe.tags field
+    'search'                full-text search, see recipes.search
+    'ordering'              'popular' or 'trending', see logic.scores
+    Boolean params rely on annotations made by
+    api.querysets.get_recipes_read_queryset.
     """
     tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
@@ -24,23 +30,40 @@ class RecipeQueryParamFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('popular', 'По популярности'),
+            ('trending', 'По популярности за последние дни'),
+        ),
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ordering'
+        )
 
     def get_is_favorited(self, queryset, name, value):
         """Make qs of current user's favorites if value True/1."""
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(
-                favourite__user=self.request.user
-            ).prefetch_related('components')
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         """Make qs of current user's basket if value True/1."""
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(
-                basket_recipes__user=self.request.user
-            ).prefetch_related('components')
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        """Make qs of recipes matching value, best matches first."""
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        """Order qs by precomputed score, recipes without score last."""
+        return queryset.order_by(
+            F(f'score__{value}').desc(nulls_last=True), '-pub_date', '-id'
+        )
@@ -0,0 +1,84 @@
+from collections import defaultdict
+
+from django.db.models.constants import LOOKUP_SEP
+
+
+def get_http_request(request):
+    """Return django HttpRequest, also for rest_framework Request."""
+    return getattr(request, '_request', request)
+
+
+class IdentityMap:
+    """Request-scoped identity map and batch loader of model instances.
+
+    Every object is kept once per model and pk. Missing objects are
+    fetched by one in_bulk() query per model for all requested pks,
+    objects already loaded by select_related/prefetch_related are
+    registered without queries.
+    """
+
+    def __init__(self):
+        self._objects = defaultdict(dict)
+
+    def prime(self, *instances):
+        """Register loaded instances, return canonical ones."""
+        result = []
+        for instance in instances:
+            objects = self._objects[instance._meta.concrete_model]
+            result.append(objects.setdefault(instance.pk, instance))
+        return result
+
+    def load_many(self, model, pks):
+        """Return {pk: instance} for existing pks, one query for missing."""
+        objects = self._objects[model._meta.concrete_model]
+        missing = set(pks) - objects.keys()
+        if missing:
+            objects.update(model._default_manager.in_bulk(missing))
+        return {pk: objects[pk] for pk in pks if pk in objects}
+
+    def attach(self, instances, path):
+        """Set related objects on instances from identity map.
+
+        Path is a forward relation name, optionally preceded by
+        many-related names: 'author', 'recipe_components__product'.
+        Many-related managers are read by .all(), so prefetch them.
+        """
+        name, _, rest = path.partition(LOOKUP_SEP)
+        if rest:
+            self.attach(
+                [item for instance in instances
+                 for item in getattr(instance, name).all()],
+                rest,
+            )
+            return
+        if not instances:
+            return
+        field = instances[0]._meta.get_field(name)
+        for instance in instances:
+            if field.is_cached(instance):
+                self.prime(field.get_cached_value(instance))
+        related = self.load_many(
+            field.related_model,
+            [getattr(instance, field.attname) for instance in instances],
+        )
+        for instance in instances:
+            pk = getattr(instance, field.attname)
+            if pk in related:
+                field.set_cached_value(instance, related[pk])
+
+
+def get_identity_map(context):
+    """Return identity map of request from serializer context.
+
+    Current user is registered in the new map. Without request the map
+    lives in the serializer context.
+    """
+    request = context.get('request')
+    if request is None:
+        return context.setdefault('identity_map', IdentityMap())
+    http_request = get_http_request(request)
+    if not hasattr(http_request, 'identity_map'):
+        http_request.identity_map = IdentityMap()
+        if request.user.is_authenticated:
+            http_request.identity_map.prime(request.user)
+    return http_request.identity_map
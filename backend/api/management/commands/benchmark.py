@@ -0,0 +1,190 @@
+import json
+from statistics import quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Product, Recipe
+from users.models import CustomUser as User
+
+# имя сценария, URL, нужна ли авторизация
+SCENARIOS = (
+    ('recipes', '/api/recipes/', False),
+    ('recipes_auth', '/api/recipes/', True),
+    ('recipes_cursor', '/api/recipes/?pagination=cursor', True),
+    ('recipe_detail', '/api/recipes/{recipe_id}/', True),
+    ('recipe_detail_guest', '/api/recipes/{recipe_id}/', False),
+    ('feed', '/api/recipes/feed/', True),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', True),
+    ('ingredients_search', '/api/ingredients/?name={ingredient}', False),
+    ('shopping_cart', '/api/recipes/download_shopping_cart/', True),
+)
+PERCENTILES = (50, 90, 99)
+
+
+def get_percentiles(timings):
+    """Return {'p50': ms, ...} of timings in seconds."""
+    if len(timings) == 1:
+        cuts = [timings[0]] * 99
+    else:
+        cuts = quantiles(timings, n=100, method='inclusive')
+    return {
+        f'p{percentile}': round(cuts[percentile - 1] * 1000, 2)
+        for percentile in PERCENTILES
+    }
+
+
+class Command(BaseCommand):
+    help = ('Benchmark hot API endpoints in process with the Django test '
+            'client against the current DB, e.g. filled by '
+            'generate_fixtures. Report latency percentiles and query '
+            'counts, compare with a saved baseline and fail on regressions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Untimed requests before each scenario',
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[name for name, _, _ in SCENARIOS],
+            help='Run only given scenarios, may be repeated',
+        )
+        parser.add_argument(
+            '--user',
+            help='Email of requesting user, by default the one with '
+                 'most subscriptions among users with non-empty basket',
+        )
+        parser.add_argument(
+            '--save-baseline', metavar='PATH',
+            help='Write results to JSON file',
+        )
+        parser.add_argument(
+            '--baseline', metavar='PATH',
+            help='Compare with results from JSON file',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed relative p50 latency growth over baseline',
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=2.0,
+            help='Latency growth below this is never a regression',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('Ошибка: неверное число итераций.')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'{options["baseline"]}: {error}')
+        params = self.get_params(options['user'])
+        token = Token.objects.get_or_create(user=params.pop('user'))[0]
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+        results = {}
+        # тестовый клиент обращается к хосту 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, url, auth in SCENARIOS:
+                if options['scenarios'] and name not in options['scenarios']:
+                    continue
+                results[name] = self.run_scenario(
+                    clients[auth], url.format(**params), options
+                )
+                self.stdout.write(self.format_result(name, results[name]))
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w',
+                      encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if baseline is not None:
+            regressions = self.compare(results, baseline, options)
+            if regressions:
+                raise CommandError(
+                    'Ошибка: регрессия производительности.\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write('Регрессий нет.')
+
+    def get_params(self, email):
+        """Return requesting user and values substituted into URLs."""
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(basket__isnull=False).distinct().order_by(
+                '-following_count', 'pk'
+            )
+        user = users.first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        product = Product.objects.annotate(
+            uses=Count('components')
+        ).order_by('-uses', 'pk').first()
+        if user is None or recipe is None or product is None:
+            raise CommandError(
+                'Ошибка: нет пользователя с корзиной, рецептов или '
+                'продуктов, сначала выполните generate_fixtures.'
+            )
+        return {
+            'user': user,
+            'recipe_id': recipe.pk,
+            'ingredient': product.name[:3],
+        }
+
+    def run_scenario(self, client, url, options):
+        """Return latency percentiles in ms and max query count."""
+        timings, queries = [], 0
+        for iteration in range(options['warmup'] + options['iterations']):
+            with CaptureQueriesContext(connection) as context:
+                start = perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(
+                    f'Ошибка: {url} вернул {response.status_code}.'
+                )
+            if iteration >= options['warmup']:
+                timings.append(elapsed)
+                queries = max(queries, len(context.captured_queries))
+        return {**get_percentiles(timings), 'queries': queries, 'url': url}
+
+    def format_result(self, name, result):
+        latency = ', '.join(
+            f'p{percentile} {result[f"p{percentile}"]:.2f}'
+            for percentile in PERCENTILES
+        )
+        return f'{name:<20} {latency} мс, запросов {result["queries"]}'
+
+    def compare(self, results, baseline, options):
+        """Return descriptions of regressions against baseline."""
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {result["queries"]}, '
+                    f'было {base["queries"]}'
+                )
+            delta = result['p50'] - base['p50']
+            if (delta > options['min_delta_ms']
+                    and delta > base['p50'] * options['tolerance']):
+                regressions.append(
+                    f'{name}: p50 {result["p50"]:.2f} мс, '
+                    f'было {base["p50"]:.2f} мс'
+                )
+        return regressions
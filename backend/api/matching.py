@@ -0,0 +1,130 @@
+import logging
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+from recipes.models import Component
+from .cache import get_version
+
+logger = logging.getLogger(__name__)
+
+RECIPE_COMPONENTS_NAMESPACE = 'recipe_components'
+
+
+class RecipeMatcher:
+    """In-memory inverted index product id -> recipes for 'what to cook'.
+
+    Recipes are numbered by position in 'recipe_ids', every product has
+    a sorted array of positions of recipes using it, 'sizes' holds the
+    number of distinct products of every recipe. Matching a set of
+    products counts positions from their arrays, so it costs the total
+    length of these arrays and no queries.
+    The index is rebuilt from recipes.Component when the
+    'recipe_components' version changes (see api.signals). Only the
+    first build is done in the request thread. Later rebuilds run in a
+    background thread, one at a time, while the previous index is
+    served, so changed recipes are matched by new data after a rebuild.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._recipe_ids = array('I')
+        self._sizes = array('H')
+        self._index = {}
+        self._lock = Lock()
+        self._build_lock = Lock()
+        self._rebuilding = False
+        self._executor = None
+
+    def build(self):
+        """Rebuild index if components were changed.
+
+        Waits for the first build only, see RecipeMatcher.
+        """
+        version = get_version(RECIPE_COMPONENTS_NAMESPACE)
+        if version == self.version:
+            return
+        if (
+            self.version is not None
+            and settings.RECIPE_MATCHER_BACKGROUND_REBUILD
+        ):
+            self.schedule_rebuild()
+            return
+        with self._build_lock:
+            if version != self.version:
+                self.rebuild(version)
+
+    def schedule_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='recipe-matcher',
+                )
+        self._executor.submit(self.rebuild_in_background)
+
+    def rebuild_in_background(self):
+        try:
+            # версия читается до загрузки ингредиентов: запись во время
+            # перестроения вызовет следующее
+            version = get_version(RECIPE_COMPONENTS_NAMESPACE)
+            with self._build_lock:
+                if version != self.version:
+                    self.rebuild(version)
+        except Exception:
+            logger.exception('Ошибка перестроения индекса рецептов')
+        finally:
+            self._rebuilding = False
+            # поток держит свои соединения с БД
+            connections.close_all()
+
+    def rebuild(self, version):
+        """Load components and replace index by one of given version."""
+        pairs = Component.objects.values_list(
+            'recipe_id', 'product_id'
+        ).order_by('recipe_id', 'product_id').distinct()
+        recipe_ids, sizes, index = array('I'), array('H'), {}
+        for recipe_id, product_id in pairs.iterator(chunk_size=10000):
+            if not recipe_ids or recipe_ids[-1] != recipe_id:
+                recipe_ids.append(recipe_id)
+                sizes.append(0)
+            sizes[-1] += 1
+            index.setdefault(product_id, array('I')).append(
+                len(recipe_ids) - 1
+            )
+        with self._lock:
+            self._recipe_ids, self._sizes = recipe_ids, sizes
+            self._index = index
+            self.version = version
+
+    def match(self, product_ids, max_missing):
+        """Return [(recipe_id, matched, missing)] of recipes using any
+        of products and missing at most max_missing of their products.
+
+        Best first: fewer missing, then more matched, then newer recipe.
+        """
+        self.build()
+        with self._lock:
+            recipe_ids, sizes, index = (
+                self._recipe_ids, self._sizes, self._index
+            )
+        matched = Counter(chain.from_iterable(
+            index.get(product_id, ()) for product_id in set(product_ids)
+        ))
+        result = [
+            (recipe_ids[position], count, sizes[position] - count)
+            for position, count in matched.items()
+            if sizes[position] - count <= max_missing
+        ]
+        result.sort(key=lambda item: (item[2], -item[1], -item[0]))
+        return result
+
+
+recipe_matcher = RecipeMatcher()
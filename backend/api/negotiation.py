@@ -0,0 +1,12 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Always choose the first renderer.
+
+    For views which use '?format=' for their own needs (export file
+    format), errors are still rendered by the default renderer.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
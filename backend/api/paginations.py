@@ -1,6 +1,249 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from logic.feed import get_feed_keys
+
+APPROXIMATE_COUNT_MIN = 1000
+
+
+def get_approximate_count(queryset):
+    """Return planner's estimate of rows count on PostgreSQL.
+
+    Estimates below APPROXIMATE_COUNT_MIN and other databases get exact
+    COUNT(*), small counts are cheap and estimates of them are rough.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+        except DatabaseError:
+            plan = None
+        if plan:
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= APPROXIMATE_COUNT_MIN:
+                return estimate
+    return queryset.count()
+
+
+class ApproximateCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return get_approximate_count(self.object_list)
 
 
 class PageLimitNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_query_param = 'page'
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination by unique ordering, e.g. ('-pub_date', '-id').
+
+    Page is selected by WHERE on ordering fields values of the last
+    (first for previous page) item, so every page costs the same as the
+    first one, no OFFSET and no COUNT(*). The cursor is opaque.
+    Ordering is taken from view's 'keyset_ordering'.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        page_size = PageLimitNumberPagination.page_size
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, view):
+        return view.keyset_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(name) for name in ordering]
+        items = self.fetch(queryset, ordering, values, page_size + 1)
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if reverse:
+            items.reverse()
+
+        self.next_values = self.previous_values = None
+        if items:
+            if has_more or reverse:
+                self.next_values = self.get_values(items[-1])
+            if values is not None and (has_more or not reverse):
+                self.previous_values = self.get_values(items[0])
+        return items
+
+    def fetch(self, queryset, ordering, values, limit):
+        """Return up to limit items following values in ordering."""
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(
+                ordering, values
+            ))
+        return list(queryset[:limit])
+
+    @staticmethod
+    def invert(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    def get_keyset_filter(self, ordering, values):
+        """Rows strictly after values in ordering.
+
+        Expanded into OR of conditions, one per ordering field: equal
+        values of preceding fields and strictly after on this one, since
+        fields may be sorted in different directions.
+        """
+        keyset_filter = Q()
+        for index, name in enumerate(ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition = Q(**{
+                f'{self.fields[index].attname}__{lookup}': values[index]
+            })
+            for field, value in zip(self.fields[:index], values):
+                condition &= Q(**{field.attname: value})
+            keyset_filter |= condition
+        return keyset_filter
+
+    def get_values(self, item):
+        return [getattr(item, field.attname) for field in self.fields]
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(data['v']) != len(self.fields):
+                raise ValueError
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, data['v'])
+            ]
+        except (BinasciiError, TypeError, KeyError, ValueError,
+                ValidationError):
+            raise NotFound('Ошибка: недействительный курсор.')
+        return values, bool(data.get('r'))
+
+    def encode_cursor(self, values, reverse=False):
+        data = {'v': values}
+        if reverse:
+            data['r'] = 1
+        # str() keeps microseconds of datetimes, DjangoJSONEncoder doesn't
+        cursor = urlsafe_b64encode(
+            json.dumps(data, default=str).encode()
+        ).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, cursor
+        )
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values)
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+
+class FeedPagination(KeysetPagination):
+    """Keyset pagination of request.user's subscriptions feed.
+
+    Keys of a page come from logic.feed, queryset only loads recipes.
+    """
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, view):
+        return self.ordering
+
+    def fetch(self, queryset, ordering, values, limit):
+        keys = get_feed_keys(
+            self.request.user, descending=ordering[0].startswith('-'),
+            after=values, limit=limit
+        )
+        recipes = queryset.in_bulk([recipe_id for _, recipe_id in keys])
+        return [
+            recipes[recipe_id] for _, recipe_id in keys
+            if recipe_id in recipes
+        ]
+
+
+class PageOrKeysetPagination(PageLimitNumberPagination):
+    """Page number pagination with opt-in modes.
+
+    '?pagination=cursor' or '?cursor=...' - KeysetPagination, needs
+    view's 'keyset_ordering'.
+    '?count=approximate' - page number pagination with approximate
+    'count' (planner estimate on PostgreSQL) instead of COUNT(*).
+    """
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        self.keyset = None
+        if getattr(view, 'keyset_ordering', None) and (
+            params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in params
+        ):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = Paginator
+        if params.get(self.count_query_param) == 'approximate':
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
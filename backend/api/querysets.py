@@ -0,0 +1,75 @@
+from django.db.models import Exists, OuterRef, Prefetch, Subquery, Value
+
+from logic.models import Basket, FavourRecipe, Follow
+from recipes.models import Component, Recipe
+
+# подписки - новые авторы первыми, для страниц и для курсора
+SUBSCRIPTIONS_ORDERING = ('-author_id',)
+
+
+def get_recipes_read_prefetches():
+    """Return prefetch lookups of RecipeReadSerializer by field source.
+
+    Done by the serializer only for recipes missing in the fragment cache
+    (api.recipe_cache), one query per lookup.
+    """
+    return {
+        'tags': 'tags',
+        'recipe_components': Prefetch(
+            'recipe_components',
+            queryset=Component.objects.select_related('product')
+        ),
+    }
+
+
+def get_recipes_read_queryset(user):
+    """Return recipes qs ready for RecipeReadSerializer.
+
+    All related data is loaded by a fixed number of queries regardless
+    of the page size:
+    1 - recipes with authors, 'is_favorited' and 'is_in_shopping_cart'
+        annotations
+    2 - tags, 3 - components with products, see
+        get_recipes_read_prefetches()
+    Authors' 'is_subscribed' is resolved by logic.follows.
+    Search vector is used only in WHERE and is not loaded.
+    """
+    queryset = Recipe.objects.select_related('author').defer(
+        'search_vector'
+    )
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False),
+        )
+    return queryset.annotate(
+        is_favorited=Exists(
+            FavourRecipe.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        is_in_shopping_cart=Exists(
+            Basket.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+    )
+
+
+def get_subscriptions_queryset(user, recipes_limit=None):
+    """Return user's Follow qs ready for SubscribeSerializer.
+
+    Queries:
+    1 - follows with authors
+    2 - authors' latest recipes, at most recipes_limit per author,
+        in 'recipes_preview' attribute of author
+    """
+    recipes = Recipe.objects.all()
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:recipes_limit]
+        ))
+    return Follow.objects.filter(user=user).select_related(
+        'author'
+    ).prefetch_related(
+        Prefetch('author__recipes', queryset=recipes,
+                 to_attr='recipes_preview')
+    ).order_by(*SUBSCRIPTIONS_ORDERING)
@@ -0,0 +1,124 @@
+"""Кеш рецептов в API.
+
+recipe_responses - ответы списка и страницы рецепта для гостей. Для
+гостя is_favorited и is_in_shopping_cart всегда False, поэтому ответ
+одинаков для всех гостей и кешируется целиком (api.cache.TaggedCache)
+по нормализованным параметрам запроса.
+recipe_fragments - рецепт, сериализованный RecipeReadSerializer, без
+полей, зависящих от пользователя (is_favorited, is_in_shopping_cart,
+author.is_subscribed). Ответы всем пользователям собираются из них,
+теги и ингредиенты загружаются только для рецептов не из кеша.
+Записи помечены тегами:
+- 'recipe:<id>', 'author:<id>', 'tag:<id>' - рецепты, авторы и теги
+  из ответа, 'products' - названия и единицы ингредиентов;
+- для списка - какие рецепты в него попадают: 'recipes' - все,
+  'recipes:author:<id>' и 'recipes:tag:<id>' - автора и с тегом,
+  'tags' - фильтр по slug тегов, 'recipes:ranked' - поиск и сортировка
+  по рейтингу, зависящие от содержимого рецептов и logic.scores.
+Сигналы api.signals после коммита записи меняют версии нужных тегов,
+остальные записи кеша остаются действительными.
+Теги фрагмента известны только после чтения рецептов, и версии, прочитанные
+после него, могут уже учитывать запись, которой нет в прочитанных данных.
+Поэтому запись тегов фрагментов меняет и версию FRAGMENT_WRITES: запрос
+запоминает её до чтения рецептов (remember_fragment_writes) и не сохраняет
+фрагменты, если она изменилась.
+"""
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import Tag
+from .cache import TaggedCache, bump_versions, get_version
+
+# параметры, которые для гостя не меняют ответ
+IGNORED_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+# меняется при каждой записи, затрагивающей фрагменты
+FRAGMENT_WRITES = 'recipe-fragments:writes'
+
+recipe_responses = TaggedCache(
+    'recipe-responses', timeout=settings.RECIPE_RESPONSE_CACHE_TIMEOUT
+)
+recipe_fragments = TaggedCache(
+    'recipe-fragments', timeout=settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+)
+
+
+def get_base_url(request):
+    """Return scheme and host of absolute links in response."""
+    return request.build_absolute_uri('/') if request is not None else ''
+
+
+def get_cache_key(request, action, pk=None):
+    """Return key of shareable response, None if it is not shareable."""
+    if not settings.RECIPE_RESPONSE_CACHE_ENABLED:
+        return None
+    if request.user.is_authenticated:
+        return None
+    author = request.query_params.get('author')
+    if author and not author.isdigit():
+        return None
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        if name not in IGNORED_PARAMS
+        for value in values
+    )
+    # ссылки в ответе абсолютные
+    return '|'.join((
+        get_base_url(request), action, str(pk), urlencode(params)
+    ))
+
+
+def get_fragment_key(request, recipe_id):
+    return f'{get_base_url(request)}|{recipe_id}'
+
+
+def get_list_tags(params):
+    """Return tags of recipes which may get into the list."""
+    tags = []
+    if params.get('author'):
+        tags.append(f'recipes:author:{int(params["author"])}')
+    slugs = params.getlist('tags')
+    if slugs:
+        tags.append('tags')
+        tags += [
+            f'recipes:tag:{tag_id}' for tag_id in Tag.objects.filter(
+                slug__in=slugs
+            ).values_list('id', flat=True)
+        ]
+    if not tags:
+        tags.append('recipes')
+    if 'search' in params or 'ordering' in params:
+        tags.append('recipes:ranked')
+    return tags
+
+
+def get_data_tags(recipes):
+    """Return tags of serialized recipes."""
+    tags = {'products'}
+    for recipe in recipes:
+        tags.add(f'recipe:{recipe["id"]}')
+        tags.add(f'author:{recipe["author"]["id"]}')
+        tags.update(f'tag:{tag["id"]}' for tag in recipe['tags'])
+    return tags
+
+
+def is_fragment_tag(tag):
+    """Return whether tag may be among tags of a recipe's fragment."""
+    return tag == 'products' or tag.startswith(('recipe:', 'author:', 'tag:'))
+
+
+def remember_fragment_writes(request):
+    """Keep version of FRAGMENT_WRITES before the request reads recipes."""
+    if settings.RECIPE_FRAGMENT_CACHE_ENABLED:
+        request.fragment_writes = get_version(FRAGMENT_WRITES)
+
+
+def invalidate_responses(tags):
+    """Make entries with any of tags stale after commit."""
+    tags = list(tags)
+    if any(map(is_fragment_tag, tags)):
+        # первой, чтобы её не увидели позже версий тегов
+        tags.insert(0, FRAGMENT_WRITES)
+    transaction.on_commit(lambda: bump_versions(tags))
@@ -1,11 +1,52 @@
-from django.shortcuts import get_object_or_404
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from logic.follows import get_followed_author_ids
 from logic.models import FavourRecipe, Follow
+from recipes.images import get_variant_names
 from recipes.models import Component, Product, Recipe, Tag
+from recipes.signals import RecipeChanges, components_changed, recipe_changed
 from users.models import CustomUser
+from .cache import get_versions
+from .loaders import get_identity_map
+from .querysets import get_recipes_read_prefetches
+from .recipe_cache import (
+    FRAGMENT_WRITES, get_data_tags, get_fragment_key, recipe_fragments,
+)
+from .timing import TimedSerializerMixin
+from .uploads import RecipeImageField
+
+
+class BatchListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """ListSerializer which loads related objects of all items at once.
+
+    Relations listed in child's 'identity_map_fields' are attached from
+    the request identity map (api.loaders.IdentityMap): one query per
+    model for the whole list, objects shared between items.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        self.attach_related(items)
+        return super().to_representation(items)
+
+    def attach_related(self, items):
+        identity_map = get_identity_map(self.context)
+        sources = {
+            field.source_attrs[0] for field in self.child.fields.values()
+            if field.source_attrs
+        }
+        for path in getattr(self.child, 'identity_map_fields', ()):
+            if path.split(LOOKUP_SEP)[0] in sources:
+                identity_map.attach(items, path)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -40,9 +81,12 @@ class ComponentSerializer(serializers.ModelSerializer):
     )
     amount = serializers.IntegerField()
 
+    identity_map_fields = ('product',)
+
     class Meta:
         model = Component
         fields = ('id', 'name', 'measurement_unit', 'amount')
+        list_serializer_class = BatchListSerializer
         validators = (
             UniqueTogetherValidator(
                 queryset=Component.objects.all(),
@@ -67,19 +111,13 @@ class CustomUserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Return True if request.user subscribed to author."""
-        user = None
-        request = self.context.get('request')
-        if request and hasattr(request, 'user'):
-            user = request.user
-        if user and user.is_authenticated:
-            return Follow.objects.filter(user=user, author=obj.id).exists()
-        return False
+        return obj.id in get_followed_author_ids(self.context.get('request'))
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Serializer for write Recipe model instance."""
     name = serializers.CharField(source='title')
-    image = Base64ImageField(
+    image = RecipeImageField(
         source='picture',
         max_length=None, use_url=True
     )
@@ -87,12 +125,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         child=serializers.DictField(child=serializers.CharField()),
         source='components'
     )
-    tags = serializers.ListField(
-        child=serializers.SlugRelatedField(
-            slug_field='id',
-            queryset=Tag.objects.all(),
-        ),
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
 
     class Meta:
         model = Recipe
@@ -102,77 +135,168 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        if data['cooking_time'] < 1:
+        if 'cooking_time' in data and data['cooking_time'] < 1:
             raise serializers.ValidationError(
                 'Ошибка: Минимальное значение времени приготовления '
                 '1 минута'
             )
+        if 'tags' in data:
+            data['tags'] = self.get_valid_tags(data['tags'])
+        if 'components' in data:
+            data['components'] = self.get_valid_components(
+                data['components']
+            )
+        return data
 
-        if not data['tags']:
+    def get_valid_tags(self, tag_ids):
+        """Return Tag objects by ids, all found by one query."""
+        if not tag_ids:
             raise serializers.ValidationError(
                 'Ошибка: Создание рецепта без тега невозможно'
             )
-        if len(data['tags']) != len(set(data['tags'])):
+        if len(tag_ids) != len(set(tag_ids)):
             raise serializers.ValidationError(
                 'Ошибка: Тег для рецепта указывается единожды'
             )
-
-        for tag in data['tags']:
-            if not Tag.objects.filter(id=tag.id).exists():
+        tags = get_identity_map(self.context).load_many(Tag, tag_ids)
+        for tag_id in tag_ids:
+            if tag_id not in tags:
                 raise serializers.ValidationError(
-                    f'Ошибка: Тега с указанным id = {tag.id} не существует'
+                    f'Ошибка: Тега с указанным id = {tag_id} не существует'
                 )
+        return [tags[tag_id] for tag_id in tag_ids]
 
-        if not data['components']:
+    def get_valid_components(self, components):
+        """Return list of {'product', 'amount'}, products found by one query.
+        """
+        if not components:
             raise serializers.ValidationError(
                 'Ошибка: Невозможно создание рецепта без ингредиента'
             )
-        compnt_ids = []
-        for component in data['components']:
-            cur_id, cur_amount = component['id'], component['amount']
-            if not Product.objects.filter(id=cur_id).exists():
+        try:
+            amounts = [
+                (int(component['id']), int(component['amount']))
+                for component in components
+            ]
+        except (KeyError, ValueError):
+            raise serializers.ValidationError(
+                'Ошибка: Для ингредиента указываются целые id и amount'
+            )
+        product_ids = [product_id for product_id, _ in amounts]
+        if len(product_ids) != len(set(product_ids)):
+            raise serializers.ValidationError(
+                'Ошибка: Ингредиент для рецепта указывается единожды'
+            )
+        products = get_identity_map(self.context).load_many(
+            Product, product_ids
+        )
+        for product_id, amount in amounts:
+            if product_id not in products:
                 raise serializers.ValidationError(
                     'Ошибка: Ингредиента '
-                    f'с указанным id = {cur_id} не существует')
-            if int(cur_amount) < 1:
+                    f'с указанным id = {product_id} не существует')
+            if amount < 1:
                 raise serializers.ValidationError(
                     'Ошибка: Минимальное количество ингредиента: 1')
-            compnt_ids.append(cur_id)
-        if len(compnt_ids) != len(set(compnt_ids)):
-            raise serializers.ValidationError(
-                'Ошибка: Ингредиент для рецепта указывается единожды'
+        return [
+            {'product': products[product_id], 'amount': amount}
+            for product_id, amount in amounts
+        ]
+
+    def update_components(self, recipe, components, changes, created):
+        """Write only added, changed and removed components of recipe."""
+        existing = {} if created else {
+            component.product_id: component
+            for component in recipe.recipe_components.all()
+        }
+        incoming = {
+            component['product'].id: component for component in components
+        }
+        changes.products_removed = existing.keys() - incoming.keys()
+        changes.products_added = incoming.keys() - existing.keys()
+        updated = []
+        for product_id, component in existing.items():
+            if (
+                product_id in incoming
+                and component.amount != incoming[product_id]['amount']
+            ):
+                component.amount = incoming[product_id]['amount']
+                updated.append(component)
+                changes.products_updated.add(product_id)
+
+        if changes.products_removed:
+            removed = Component.objects.filter(
+                recipe=recipe, product_id__in=changes.products_removed
+            )
+            removed._raw_delete(removed.db)
+        if updated:
+            Component.objects.bulk_update(updated, ('amount',))
+        Component.objects.bulk_create(
+            Component(recipe=recipe, **incoming[product_id])
+            for product_id in changes.products_added
+        )
+        # ингредиенты пишутся без сигналов модели Component, по одному
+        # на строку; получатели узнают обо всех изменениях разом
+        if changes.products_changed:
+            components_changed.send(
+                sender=Component, recipe_ids=[recipe.id], created=created
             )
-        return data
 
-    def add_components_and_tags(self, recipe, validated_data):
-        components, tags = (
-            validated_data.pop('components'), validated_data.pop('tags')
+    def update_tags(self, recipe, tags, changes, created):
+        """Write only added and removed tags of recipe."""
+        existing = set() if created else set(
+            recipe.tags.values_list('id', flat=True)
         )
-        for component in components:
-            _, created = Component.objects.get_or_create(
-                product=get_object_or_404(Product, id=component['id']),
-                amount=component['amount'],
-                recipe=recipe
+        incoming = {tag.id for tag in tags}
+        changes.tags_removed = existing - incoming
+        changes.tags_added = incoming - existing
+        if changes.tags_removed:
+            recipe.tags.remove(*changes.tags_removed)
+        if changes.tags_added:
+            recipe.tags.add(*changes.tags_added)
+
+    def write_relations(self, recipe, relations, changes, created=False):
+        """Write components and tags, report changes by recipe_changed.
+
+        Changes are also available as serializer.changes after save().
+        """
+        if 'components' in relations:
+            self.update_components(
+                recipe, relations['components'], changes, created
+            )
+        if 'tags' in relations:
+            self.update_tags(recipe, relations['tags'], changes, created)
+        self.changes = changes
+        if changes:
+            recipe_changed.send(
+                sender=Recipe, instance=recipe,
+                created=created, changes=changes,
             )
-            if not created:
-                raise serializers.ValidationError(
-                    'Ошибка: Ингредиент для рецепта указывается единожды'
-                )
-        recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def create(self, validated_data):
-        m2m_data = {}
-        m2m_data['components'] = validated_data.pop('components')
-        m2m_data['tags'] = validated_data.pop('tags')
+        relations = {
+            name: validated_data.pop(name) for name in ('components', 'tags')
+        }
         recipe = Recipe.objects.create(**validated_data)
-        return self.add_components_and_tags(recipe, m2m_data)
+        changes = RecipeChanges(fields=set(validated_data))
+        return self.write_relations(recipe, relations, changes, created=True)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.components.clear()
-        instance.tags.clear()
-        instance = self.add_components_and_tags(instance, validated_data)
-        return super().update(instance, validated_data)
+        changes = RecipeChanges()
+        relations = {
+            name: validated_data.pop(name)
+            for name in ('components', 'tags') if name in validated_data
+        }
+        for attr, value in validated_data.items():
+            if getattr(instance, attr) != value:
+                setattr(instance, attr, value)
+                changes.fields.add(attr)
+        if changes.fields:
+            instance.save(update_fields=changes.fields)
+        return self.write_relations(instance, relations, changes)
 
 
 class DynamicFieldsModelSerializer(serializers.ModelSerializer):
@@ -191,8 +315,29 @@ class DynamicFieldsModelSerializer(serializers.ModelSerializer):
                 self.fields.pop(field_name)
 
 
-class RecipeReadSerializer(DynamicFieldsModelSerializer):
-    """Return dynamical list of fields."""
+class RecipeListSerializer(BatchListSerializer):
+    """BatchListSerializer of recipes cached by fragments.
+
+    Related objects are loaded only for recipes without cached fragment,
+    see RecipeReadSerializer.load_fragments().
+    """
+
+    def attach_related(self, items):
+        super().attach_related(self.child.load_fragments(items))
+
+    def to_representation(self, data):
+        result = super().to_representation(data)
+        self.child.save_fragments()
+        return result
+
+
+class RecipeReadSerializer(TimedSerializerMixin,
+                           DynamicFieldsModelSerializer):
+    """Return dynamical list of fields.
+
+    Fields same for all users are taken from api.recipe_cache when the
+    serializer shows all of them, the others are computed per request.
+    """
     name = serializers.CharField(source='title')
     image = Base64ImageField(max_length=None, use_url=True, source='picture')
     author = CustomUserSerializer(read_only=True)
@@ -207,6 +352,14 @@ class RecipeReadSerializer(DynamicFieldsModelSerializer):
     tags = TagSerializer(many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    identity_map_fields = ('author', 'recipe_components__product')
+    # поля фрагмента в кеше; author.is_subscribed в нём подменяется
+    fragment_fields = (
+        'id', 'tags', 'author', 'ingredients',
+        'name', 'image', 'image_variants', 'text', 'cooking_time'
+    )
 
     class Meta:
         model = Recipe
@@ -215,9 +368,107 @@ class RecipeReadSerializer(DynamicFieldsModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def use_fragments(self):
+        return (
+            settings.RECIPE_FRAGMENT_CACHE_ENABLED
+            and set(self.fragment_fields) <= self.fields.keys()
         )
 
+    def load_fragments(self, recipes):
+        """Take cached fragments of recipes, return recipes without them.
+
+        Relations shown by the serializer are prefetched for the returned
+        recipes only.
+        """
+        self.fragments, self.built = {}, {}
+        missing = recipes
+        if self.use_fragments():
+            request = self.context.get('request')
+            keys = {
+                recipe.pk: get_fragment_key(request, recipe.pk)
+                for recipe in recipes
+            }
+            cached = recipe_fragments.get_many(keys.values())
+            self.fragments = {
+                pk: cached[key] for pk, key in keys.items() if key in cached
+            }
+            missing = [
+                recipe for recipe in recipes
+                if recipe.pk not in self.fragments
+            ]
+        sources = {field.source for field in self.fields.values()}
+        prefetch_related_objects(missing, *(
+            lookup for source, lookup in get_recipes_read_prefetches().items()
+            if source in sources
+        ))
+        return missing
+
+    def save_fragments(self):
+        """Store fragments of recipes serialized without cache.
+
+        Nothing is stored if a fragment write was committed since the
+        request started, see api.recipe_cache.
+        """
+        built, self.built = self.built, {}
+        if not built:
+            return
+        tags = {
+            pk: get_data_tags([fragment]) for pk, fragment in built.items()
+        }
+        versions = get_versions({FRAGMENT_WRITES}.union(*tags.values()))
+        request = self.context.get('request')
+        if versions[FRAGMENT_WRITES] != getattr(
+            request, 'fragment_writes', None
+        ):
+            return
+        recipe_fragments.set_many({
+            get_fragment_key(request, pk): (
+                fragment, {tag: versions[tag] for tag in tags[pk]}
+            )
+            for pk, fragment in built.items()
+        })
+
+    def to_representation(self, instance):
+        single = not isinstance(self.parent, RecipeListSerializer)
+        if single:
+            self.load_fragments([instance])
+        fragment = self.fragments.get(instance.pk)
+        if fragment is not None:
+            return self.overlay(fragment, instance)
+        data = super().to_representation(instance)
+        if self.use_fragments():
+            self.built[instance.pk] = OrderedDict(
+                (name, data[name]) for name in self.fragment_fields
+            )
+        if single:
+            self.save_fragments()
+        return data
+
+    def overlay(self, fragment, instance):
+        """Return cached fragment with fields computed for the user."""
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in fragment:
+                ret[field.field_name] = fragment[field.field_name]
+                continue
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        if 'author' in ret:
+            ret['author'] = OrderedDict(
+                ret['author'],
+                is_subscribed=instance.author_id in get_followed_author_ids(
+                    self.context.get('request')
+                ),
+            )
+        return ret
+
     def get_user(self):
         user = None
         request = self.context.get('request')
@@ -226,17 +477,52 @@ class RecipeReadSerializer(DynamicFieldsModelSerializer):
         return user
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.get_user()
         if user and user.is_authenticated:
             return obj.favourite.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.get_user()
         if user and user.is_authenticated:
             return obj.basket_recipes.filter(user=user).exists()
         return False
 
+    def get_image_variants(self, obj):
+        """Return {variant: {format: url}} of resized copies of image.
+
+        None until copies are made by recipes.images, 'image' is used then.
+        """
+        if not obj.picture or obj.processed_picture != obj.picture.name:
+            return None
+        request = self.context.get('request')
+        return {
+            variant: {
+                image_format: (
+                    request.build_absolute_uri(default_storage.url(name))
+                    if request else default_storage.url(name)
+                )
+                for image_format, name in names.items()
+            }
+            for variant, names in get_variant_names(obj.picture.name).items()
+        }
+
+
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Recipe with numbers of matched and missing products.
+
+    Numbers are set on instances by RecipeViewSet.match.
+    """
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('matched', 'missing')
+
 
 class FavouriteSerializer(serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
@@ -287,31 +573,33 @@ class SubscribeSerializer(serializers.ModelSerializer):
     )
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(
+        source='author.recipes_count', read_only=True
+    )
 
-    recipe_fields = ('id', 'name', 'image', 'cooking_time')
+    recipe_fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+    identity_map_fields = ('author',)
 
     class Meta:
         model = Follow
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = BatchListSerializer
 
     def get_is_subscribed(self, obj):
-        is_subscribed = Follow.objects.filter(
-            user=obj.user, author=obj.author).exists()
-        return is_subscribed
+        """Follow instance is the subscription of obj.user to obj.author."""
+        return True
 
     def get_recipes(self, obj):
-        request = self.context['request']
-        recipes_per_user = None
-        if 'recipes_limit' in request.query_params:
-            recipes_per_user = int(request.query_params['recipes_limit'])
-        queryset = Recipe.objects.filter(
-            author=obj.author
-        )[:recipes_per_user]
+        """Latest author's recipes, prefetched by get_subscriptions_queryset
+        or limited by 'recipes_limit' from context.
+        """
+        if hasattr(obj.author, 'recipes_preview'):
+            queryset = obj.author.recipes_preview
+        else:
+            queryset = Recipe.objects.filter(
+                author=obj.author
+            )[:self.context.get('recipes_limit')]
         serializer = RecipeReadSerializer(queryset, many=True,
                                           fields=self.recipe_fields)
         return serializer.data
-
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
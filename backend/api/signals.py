@@ -0,0 +1,137 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from logic.models import RecipeScore
+from logic.scores import scores_updated
+from recipes.images import images_processed
+from recipes.models import Component, Product, Recipe, Tag
+from recipes.signals import (
+    components_changed, products_loaded, recipes_imported,
+)
+from users.models import CustomUser as User
+from .cache import bump_version, product_catalogue
+from .matching import RECIPE_COMPONENTS_NAMESPACE
+from .recipe_cache import invalidate_responses
+
+# поля пользователя, которые есть в ответах с рецептами
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(products_loaded, sender=Product)
+def invalidate_product_catalogue(sender, **kwargs):
+    # каталог, перестроенный до коммита, остался бы со старыми данными
+    transaction.on_commit(
+        lambda: bump_version(product_catalogue.namespace)
+    )
+
+
+def bump_recipe_components_version():
+    bump_version(RECIPE_COMPONENTS_NAMESPACE)
+
+
+@receiver(components_changed, sender=Component)
+def invalidate_recipe_matcher(sender, **kwargs):
+    # другие процессы не должны перестроить индекс до коммита
+    transaction.on_commit(bump_recipe_components_version)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe_responses(sender, instance, created, **kwargs):
+    # теги нового рецепта добавляются позже, см. m2m_changed
+    if created:
+        tags = ['recipes', f'recipes:author:{instance.author_id}']
+    else:
+        tags = [f'recipe:{instance.pk}']
+    invalidate_responses(tags + ['recipes:ranked'])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_tags(sender, instance, **kwargs):
+    instance.tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe_responses(sender, instance, **kwargs):
+    invalidate_responses([
+        f'recipe:{instance.pk}', 'recipes',
+        f'recipes:author:{instance.author_id}', 'recipes:ranked',
+        *(f'recipes:tag:{tag_id}' for tag_id in instance.tag_ids),
+    ])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_responses(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if action == 'pre_clear':
+        related = instance.recipes if reverse else instance.tags
+        pk_set = set(related.values_list('id', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    recipe_ids, tag_ids = (
+        (pk_set, {instance.pk}) if reverse else ({instance.pk}, pk_set)
+    )
+    invalidate_responses([
+        *(f'recipe:{recipe_id}' for recipe_id in recipe_ids),
+        *(f'recipes:tag:{tag_id}' for tag_id in tag_ids),
+    ])
+
+
+@receiver(components_changed, sender=Component)
+def invalidate_components_recipes_responses(sender, recipe_ids, created,
+                                            **kwargs):
+    # списки с новыми рецептами сбрасываются по post_save и recipes_imported
+    if not created:
+        invalidate_responses([
+            *(f'recipe:{recipe_id}' for recipe_id in recipe_ids),
+            'recipes:ranked',
+        ])
+
+
+@receiver(recipes_imported, sender=Recipe)
+def invalidate_imported_recipes_responses(sender, recipe_ids, **kwargs):
+    author_ids = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'author_id', flat=True
+    ).distinct()
+    tag_ids = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('tag_id', flat=True).distinct()
+    invalidate_responses([
+        'recipes', 'recipes:ranked',
+        *(f'recipes:author:{author_id}' for author_id in author_ids),
+        *(f'recipes:tag:{tag_id}' for tag_id in tag_ids),
+    ])
+
+
+@receiver(images_processed, sender=Recipe)
+def invalidate_processed_images_responses(sender, recipe_ids, **kwargs):
+    invalidate_responses(f'recipe:{recipe_id}' for recipe_id in recipe_ids)
+
+
+@receiver(scores_updated, sender=RecipeScore)
+def invalidate_ranked_responses(sender, **kwargs):
+    invalidate_responses(['recipes:ranked'])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+    invalidate_responses([
+        f'tag:{instance.pk}', f'recipes:tag:{instance.pk}', 'tags',
+    ])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, **kwargs):
+    invalidate_responses(['products'])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, update_fields, **kwargs):
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        invalidate_responses([f'author:{instance.pk}'])
@@ -0,0 +1,808 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from logic.counters import reconcile_counters
+from logic.models import (
+    Basket, FavourRecipe, FeedEntry, Follow, ShoppingListItem,
+)
+from recipes.models import Component, Product, Recipe, Tag
+from recipes.signals import components_changed
+from users.models import CustomUser as User
+from .cache import get_version, product_catalogue
+from .serializers import RecipeReadSerializer
+from .uploads import JSONImageScanner
+
+
+def create_png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def create_recipes(authors, tags, products, count):
+    """Create count recipes with two tags and three components each."""
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=authors[number % len(authors)],
+            title=f'Рецепт {number}',
+            picture=f'recipes/recipe{number}.png',
+            text='Описание',
+            cooking_time=number + 1,
+        )
+        recipe.tags.set(tags[number % 2:number % 2 + 2])
+        Component.objects.bulk_create(
+            Component(recipe=recipe, product=product, amount=number + 1)
+            for product in products[number % 3:number % 3 + 3]
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeAPITestCase(TestCase):
+    """Recipes of two authors, user follows one and has favorites."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.other_author = (
+            User.objects.create_user(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name=name, last_name=name, password='Pa55word!'
+            )
+            for name in ('user', 'author', 'other')
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color='#FFFFFF', slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        cls.products = [
+            Product.objects.create(
+                name=f'Продукт {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.recipes = create_recipes(
+            (cls.author, cls.other_author), cls.tags, cls.products, 8
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        FavourRecipe.objects.create(user=cls.user, recipe=cls.recipes[0])
+        Basket.objects.create(user=cls.user, recipe=cls.recipes[1])
+
+    def setUp(self):
+        cache.clear()
+        self.guest = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+@override_settings(
+    RECIPE_RESPONSE_CACHE_ENABLED=False,
+    RECIPE_FRAGMENT_CACHE_ENABLED=False,
+)
+class RecipeReadQueriesTest(RecipeAPITestCase):
+    """Recipes are read by a number of queries independent of page size.
+
+    Response and fragment caches are off, every recipe is serialized.
+    """
+
+    def get_clients(self, guest_queries):
+        return (
+            ('guest', self.guest, guest_queries),
+            ('user', self.client, guest_queries + 1),
+        )
+
+    def test_list_queries(self):
+        # slug тегов для фильтра, число рецептов, страница, теги,
+        # ингредиенты с продуктами, для пользователя - id авторов,
+        # на которых он подписан
+        for name, client, queries in self.get_clients(5):
+            for limit in (1, 6):
+                with self.subTest(client=name, limit=limit):
+                    with self.assertNumQueries(queries):
+                        response = client.get(
+                            '/api/recipes/', {'limit': limit}
+                        )
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_queries(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        for name, client, queries in self.get_clients(4):
+            with self.subTest(client=name):
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_user_fields(self):
+        response = self.client.get('/api/recipes/', {'limit': 8})
+        recipes = {recipe['id']: recipe for recipe in response.data['results']}
+        first, second = self.recipes[0].pk, self.recipes[1].pk
+        self.assertTrue(recipes[first]['is_favorited'])
+        self.assertFalse(recipes[first]['is_in_shopping_cart'])
+        self.assertTrue(recipes[second]['is_in_shopping_cart'])
+        self.assertTrue(recipes[first]['author']['is_subscribed'])
+        self.assertFalse(recipes[second]['author']['is_subscribed'])
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, DEBUG=False)
+class ServerTimingTest(RecipeAPITestCase):
+    """Server-Timing header is shown to staff only."""
+
+    def test_header(self):
+        staff = User.objects.create_user(
+            email='staff@foodgram.ru', username='staff', first_name='staff',
+            last_name='staff', password='Pa55word!', is_staff=True
+        )
+        staff_client = APIClient()
+        staff_client.force_authenticate(staff)
+        for name, client, shown in (
+            ('guest', self.guest, False),
+            ('user', self.client, False),
+            ('staff', staff_client, True),
+        ):
+            with self.subTest(client=name):
+                response = client.get('/api/recipes/')
+                self.assertEqual('Server-Timing' in response, shown)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class RecipeResponseCacheTest(RecipeAPITestCase):
+    """Cached guest responses are the same as fresh ones after writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        picture = Recipe.picture.field.storage.save(
+            'recipes/recipe.png', ContentFile(create_png('orange'))
+        )
+        Recipe.objects.update(picture=picture)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.urls = (
+            '/api/recipes/',
+            '/api/recipes/?limit=3&page=2',
+            f'/api/recipes/?author={self.author.pk}',
+            f'/api/recipes/?author={self.other_author.pk}',
+            *(f'/api/recipes/?tags={tag.slug}' for tag in self.tags),
+            f'/api/recipes/{self.recipe.pk}/',
+            f'/api/recipes/{self.recipes[1].pk}/',
+        )
+
+    def get_cached(self):
+        return {url: self.guest.get(url).json() for url in self.urls}
+
+    def get_fresh(self):
+        with self.settings(
+            RECIPE_RESPONSE_CACHE_ENABLED=False,
+            RECIPE_FRAGMENT_CACHE_ENABLED=False,
+        ):
+            return self.get_cached()
+
+    def assert_cache_fresh(self, write):
+        """Fill cache, write() after commit, compare with fresh responses."""
+        self.get_cached()
+        before = self.get_cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        fresh = self.get_fresh()
+        self.assertNotEqual(before, fresh, 'запись не изменила ответы')
+        cached = self.get_cached()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(cached[url], fresh[url])
+
+    def patch_recipe(self, data):
+        response = self.author_client.patch(
+            f'/api/recipes/{self.recipe.pk}/', data, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_ingredient_amount(self):
+        self.assert_cache_fresh(lambda: self.patch_recipe({'ingredients': [
+            {'id': component.product_id, 'amount': component.amount + 10}
+            for component in Component.objects.filter(recipe=self.recipe)
+        ]}))
+
+    def test_tags(self):
+        self.assert_cache_fresh(
+            lambda: self.patch_recipe({'tags': [self.tags[2].pk]})
+        )
+
+    def test_author_rename(self):
+        def write():
+            self.author.first_name = 'Переименован'
+            self.author.save()
+
+        self.assert_cache_fresh(write)
+
+    def test_product_rename(self):
+        def write():
+            product = self.recipe.components.first()
+            product.name = 'Переименован'
+            product.save()
+
+        self.assert_cache_fresh(write)
+
+    def test_delete(self):
+        self.assert_cache_fresh(lambda: self.author_client.delete(
+            f'/api/recipes/{self.recipe.pk}/'
+        ))
+
+    def test_import(self):
+        path = os.path.join(MEDIA_ROOT, 'recipes.jsonl')
+        call_command(
+            'export_recipes', path, '--no-images', stderr=io.StringIO()
+        )
+
+        def write():
+            self.recipe.delete()
+            call_command('import_recipes', path, stdout=io.StringIO())
+
+        self.assert_cache_fresh(write)
+
+    def test_image_replace(self):
+        def write():
+            response = self.author_client.put(
+                f'/api/recipes/{self.recipe.pk}/image/',
+                create_png('green'), content_type='image/png'
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+
+        self.assert_cache_fresh(write)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ExportRecipesTest(RecipeAPITestCase):
+    """Images are read from the picture storage, missing ones skipped."""
+
+    def test_missing_image(self):
+        storage = Recipe.picture.field.storage
+        picture = storage.save(
+            'recipes/export.png', ContentFile(create_png('orange'))
+        )
+        self.addCleanup(storage.delete, picture)
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(picture=picture)
+        path = os.path.join(MEDIA_ROOT, 'export.jsonl')
+        errors = io.StringIO()
+        call_command('export_recipes', path, stderr=errors)
+        with open(path, encoding='utf-8') as output:
+            items = [json.loads(line) for line in output]
+        self.assertEqual(len(items), len(self.recipes))
+        self.assertEqual(
+            base64.b64decode(items[0]['image_data']), create_png('orange')
+        )
+        for item in items[1:]:
+            with self.subTest(image=item['image']):
+                self.assertNotIn('image_data', item)
+                self.assertIn(item['image'], errors.getvalue())
+
+
+def escape_base64(data):
+    """Base64 JSON string value with escapes a JSON encoder may write."""
+    text = base64.b64encode(data).decode()
+    middle = len(text) // 2
+    return (
+        '\\u%04x' % ord(text[0]) + text[1:middle] + '\\n'
+        + text[middle:].replace('/', '\\/')
+    )
+
+
+class JSONImageScannerTest(SimpleTestCase):
+    """Image is cut out of JSON whatever chunks the text comes in."""
+    image = create_png('orange')
+    text = (
+        '{"name": "Суп \\"с\\" \\u0443ткой", "\\"image": "не картинка", '
+        '"im\\u0061ge": "data:image/png;base64,' + escape_base64(image)
+        + '", "tags": [1]}'
+    )
+    data = {'name': 'Суп "с" уткой', '"image': 'не картинка', 'image': '',
+            'tags': [1]}
+
+    def scan(self, chunks):
+        scanner = JSONImageScanner('image')
+        for chunk in chunks:
+            scanner.feed(chunk)
+        self.assertEqual(json.loads(scanner.get_text()), self.data)
+        self.assertEqual(scanner.image.content_type, 'image/png')
+        self.assertEqual(scanner.image.read(), self.image)
+        scanner.image.close()
+
+    def test_two_chunks(self):
+        # граница проходит через экранирование, четвёрки base64 и data URL
+        for position in range(len(self.text) + 1):
+            with self.subTest(position=position):
+                self.scan((self.text[:position], self.text[position:]))
+
+    def test_one_char_chunks(self):
+        self.scan(self.text)
+
+    def test_invalid_escape(self):
+        scanner = JSONImageScanner('image')
+        with self.assertRaises(ValidationError):
+            scanner.feed('{"image": "data:image/png;base64,iVBO\\"Rw0K"}')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class RecipeImageUploadTest(RecipeAPITestCase):
+    """Image comes as base64 in JSON, multipart file or raw body."""
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.image = create_png('green')
+        self.data = {
+            'name': 'Новый', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tags[0].pk],
+            'ingredients': [{'id': self.products[0].pk, 'amount': 3}],
+        }
+
+    def post_json(self, image):
+        return self.author_client.post('/api/recipes/', {
+            **self.data,
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                image
+            ).decode(),
+        }, format='json')
+
+    def post_multipart(self, image):
+        return self.author_client.post('/api/recipes/', {
+            **self.data,
+            'tags': json.dumps(self.data['tags']),
+            'ingredients': json.dumps(self.data['ingredients']),
+            'image': ContentFile(image, name='image.png'),
+        }, format='multipart')
+
+    def put_image(self, image):
+        return self.author_client.put(
+            f'/api/recipes/{self.recipes[0].pk}/image/', image,
+            content_type='image/png'
+        )
+
+    def assert_saved(self, response, status_code):
+        self.assertEqual(response.status_code, status_code, response.data)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.addCleanup(recipe.picture.storage.delete, recipe.picture.name)
+        with recipe.picture.open() as picture:
+            self.assertEqual(picture.read(), self.image)
+        return recipe
+
+    def assert_created(self, response):
+        recipe = self.assert_saved(response, 201)
+        self.assertEqual(recipe.title, self.data['name'])
+        self.assertEqual(
+            list(recipe.tags.values_list('id', flat=True)), self.data['tags']
+        )
+        self.assertEqual(
+            list(recipe.recipe_components.values_list('amount', flat=True)),
+            [3]
+        )
+
+    def test_json(self):
+        self.assert_created(self.post_json(self.image))
+
+    def test_multipart(self):
+        self.assert_created(self.post_multipart(self.image))
+
+    def test_raw_body(self):
+        self.assert_saved(self.put_image(self.image), 200)
+
+    def test_invalid_image(self):
+        for name, upload in (
+            ('json', self.post_json),
+            ('multipart', self.post_multipart),
+            ('raw', self.put_image),
+        ):
+            with self.subTest(upload=name):
+                response = upload(b'not an image')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=64)
+    def test_too_large(self):
+        count = Recipe.objects.count()
+        for name, upload in (
+            ('json', self.post_json),
+            ('multipart', self.post_multipart),
+            ('raw', self.put_image),
+        ):
+            with self.subTest(upload=name):
+                response = upload(self.image)
+                self.assertEqual(response.status_code, 413)
+        self.assertEqual(Recipe.objects.count(), count)
+
+
+@override_settings(RECIPE_FRAGMENT_CACHE_ENABLED=True)
+class RecipeFragmentCacheTest(RecipeAPITestCase):
+    """Users share cached fragments, their own fields are computed."""
+
+    def get_recipes(self, client):
+        response = client.get('/api/recipes/', {'limit': 8})
+        return {recipe['id']: recipe for recipe in response.data['results']}
+
+    def test_user_fields(self):
+        other_client = APIClient()
+        other_client.force_authenticate(self.other_author)
+        first, second = self.recipes[0].pk, self.recipes[1].pk
+        # фрагменты заполняет другой пользователь
+        self.get_recipes(other_client)
+        recipes = self.get_recipes(self.client)
+        self.assertTrue(recipes[first]['is_favorited'])
+        self.assertTrue(recipes[second]['is_in_shopping_cart'])
+        self.assertTrue(recipes[first]['author']['is_subscribed'])
+        self.assertFalse(recipes[second]['author']['is_subscribed'])
+        recipes = self.get_recipes(other_client)
+        self.assertFalse(recipes[first]['is_favorited'])
+        self.assertFalse(recipes[second]['is_in_shopping_cart'])
+        self.assertFalse(recipes[first]['author']['is_subscribed'])
+
+    def test_list_queries(self):
+        # без фрагментов: slug тегов для фильтра, число рецептов, страница,
+        # id авторов в подписках, теги, ингредиенты с продуктами; из
+        # фрагментов теги и ингредиенты не загружаются
+        for state, queries in (('cold', 6), ('warm', 4)):
+            with self.subTest(state=state):
+                with self.assertNumQueries(queries):
+                    response = self.client.get('/api/recipes/', {'limit': 6})
+                self.assertEqual(len(response.data['results']), 6)
+
+    def test_write_while_serializing(self):
+        recipe = self.recipes[0]
+        load_fragments = RecipeReadSerializer.load_fragments
+
+        def load_after_write(serializer, recipes):
+            # запись закоммичена после чтения рецептов, до сериализации
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.title = f'{recipe.title} (изменён)'
+                recipe.save(update_fields=('title',))
+            return load_fragments(serializer, recipes)
+
+        for name, url in (
+            ('list', '/api/recipes/?limit=8'),
+            ('detail', f'/api/recipes/{recipe.pk}/'),
+        ):
+            with self.subTest(request=name):
+                with mock.patch.object(
+                    RecipeReadSerializer, 'load_fragments', load_after_write
+                ):
+                    self.client.get(url)
+                response = self.client.get(f'/api/recipes/{recipe.pk}/')
+                self.assertEqual(response.data['name'], recipe.title)
+
+
+class ProductCatalogueTest(TestCase):
+    """Catalogue version changes only after the product is committed."""
+
+    def test_version_bumped_on_commit(self):
+        product = Product.objects.create(name='Соль', measurement_unit='г')
+        version = get_version(product_catalogue.namespace)
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.name = 'Сахар'
+            product.save()
+            self.assertEqual(
+                get_version(product_catalogue.namespace), version
+            )
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(product_catalogue.namespace), version)
+
+
+class ShoppingListTest(RecipeAPITestCase):
+    """Materialized shopping list equals the sum over the basket."""
+
+    def assert_shopping_list(self):
+        expected = dict(
+            Component.objects.filter(
+                recipe__basket_recipes__user=self.user
+            ).values_list('product').annotate(total=Sum('amount')).order_by()
+        )
+        self.assertEqual(
+            dict(self.user.shopping_list.values_list('product', 'amount')),
+            expected
+        )
+        self.assertFalse(
+            ShoppingListItem.objects.filter(amount__lte=0).exists()
+        )
+
+    def test_basket_add_remove(self):
+        self.assert_shopping_list()
+        for method, recipe, code in (
+            ('post', self.recipes[2], 201),
+            ('post', self.recipes[3], 201),
+            ('delete', self.recipes[1], 204),
+            ('delete', self.recipes[2], 204),
+        ):
+            with self.subTest(method=method, recipe=recipe.pk):
+                response = getattr(self.client, method)(
+                    f'/api/recipes/{recipe.pk}/shopping_cart/'
+                )
+                self.assertEqual(response.status_code, code)
+                self.assert_shopping_list()
+
+    def test_recipe_components_edit(self):
+        recipe = self.recipes[1]
+        author_client = APIClient()
+        author_client.force_authenticate(recipe.author)
+        ingredients = [
+            {'id': self.products[1].pk, 'amount': 100},
+            {'id': self.products[5].pk, 'amount': 7},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = author_client.patch(
+                f'/api/recipes/{recipe.pk}/', {'ingredients': ingredients},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assert_shopping_list()
+
+    def test_component_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.create(
+                recipe=self.recipes[1], product=self.products[0], amount=5
+            )
+        self.assert_shopping_list()
+
+    def test_product_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[2].delete()
+        self.assert_shopping_list()
+
+    def test_recipe_deleted(self):
+        Basket.objects.create(user=self.user, recipe=self.recipes[2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[1].delete()
+        self.assert_shopping_list()
+
+
+class ComponentsChangedTest(RecipeAPITestCase):
+    """Ingredients written by API are reported by one signal."""
+
+    def test_one_signal_per_write(self):
+        sent, deleted = [], []
+
+        def on_changed(sender, recipe_ids, created, **kwargs):
+            sent.append((list(recipe_ids), created))
+
+        def on_deleted(sender, **kwargs):
+            deleted.append(kwargs['instance'])
+
+        components_changed.connect(on_changed, sender=Component)
+        post_delete.connect(on_deleted, sender=Component)
+        self.addCleanup(components_changed.disconnect, on_changed,
+                        sender=Component)
+        self.addCleanup(post_delete.disconnect, on_deleted, sender=Component)
+        recipe = self.recipes[0]
+        author_client = APIClient()
+        author_client.force_authenticate(recipe.author)
+        # из трёх ингредиентов один изменён, два удалены, один добавлен
+        response = author_client.patch(
+            f'/api/recipes/{recipe.pk}/', {'ingredients': [
+                {'id': self.products[0].pk, 'amount': 50},
+                {'id': self.products[5].pk, 'amount': 5},
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(sent, [([recipe.pk], False)])
+        self.assertEqual(deleted, [])
+        self.assertEqual(
+            set(recipe.recipe_components.values_list('product', 'amount')),
+            {(self.products[0].pk, 50), (self.products[5].pk, 5)}
+        )
+
+
+class KeysetPaginationTest(RecipeAPITestCase):
+    """'?pagination=cursor' walks the same order as page numbers."""
+
+    def walk(self, url, limit):
+        """Return ids of pages by next links, then back by previous."""
+        forward, backward = [], []
+        response = self.client.get(
+            url, {'pagination': 'cursor', 'limit': limit}
+        )
+        while True:
+            forward.append([item['id'] for item in response.data['results']])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        while response.data['previous'] is not None:
+            response = self.client.get(response.data['previous'])
+            backward.append([item['id'] for item in response.data['results']])
+        return forward, backward
+
+    def get_page_ids(self, url):
+        response = self.client.get(url, {'limit': 100})
+        return [item['id'] for item in response.data['results']]
+
+    def assert_round_trip(self, url):
+        expected = self.get_page_ids(url)
+        for limit in (1, 3, 8, 20):
+            with self.subTest(url=url, limit=limit):
+                forward, backward = self.walk(url, limit)
+                self.assertEqual(sum(forward, []), expected)
+                self.assertTrue(all(forward))
+                self.assertEqual(backward, forward[-2::-1])
+
+    def test_recipes_round_trip(self):
+        self.assert_round_trip('/api/recipes/')
+
+    def test_equal_pub_dates(self):
+        # порядок одинаковых дат задаёт id
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in self.recipes[2:6]
+        ]).update(pub_date=timezone.now())
+        self.assert_round_trip('/api/recipes/')
+        ids = self.get_page_ids('/api/recipes/')
+        tied = [pk for pk in ids if pk in {
+            recipe.pk for recipe in self.recipes[2:6]
+        }]
+        self.assertEqual(tied, sorted(tied, reverse=True))
+
+    def test_subscriptions_round_trip(self):
+        for number in range(4):
+            author = User.objects.create_user(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}', first_name='author',
+                last_name='author', password='Pa55word!'
+            )
+            Follow.objects.create(user=self.user, author=author)
+        Follow.objects.create(user=self.user, author=self.other_author)
+        url = '/api/users/subscriptions/'
+        self.assert_round_trip(url)
+        ids = self.get_page_ids(url)
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_invalid_cursor(self):
+        for cursor in (
+            'garbage', 'e30=', 'eyJ2IjogWzFdfQ==',
+            'eyJ2IjogWyJ4IiwgIngiXX0=',
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTest(RecipeAPITestCase):
+    """Feed equals recipes of followed authors, fanned out or not.
+
+    One follower is the limit: author has the user as follower,
+    other_author is popular after two follows.
+    """
+
+    def get_feed_ids(self, client):
+        response = client.get('/api/recipes/feed/', {'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def get_expected_ids(self, user):
+        return list(Recipe.objects.filter(
+            author__following__user=user
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def get_entry_ids(self, user, author):
+        return set(FeedEntry.objects.filter(
+            user=user, author=author
+        ).values_list('recipe_id', flat=True))
+
+    def create_recipe(self, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=author, title='Новый', text='Описание',
+                cooking_time=1
+            )
+
+    def follow(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Follow.objects.create(user=user, author=author)
+
+    @override_settings(FEED_BACKFILL_RECIPES=2)
+    def test_follow_backfills_latest_recipes(self):
+        self.follow(self.author, self.other_author)
+        latest = Recipe.objects.filter(author=self.other_author).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True)[:2]
+        self.assertEqual(
+            self.get_entry_ids(self.author, self.other_author), set(latest)
+        )
+
+    def test_unfollow_cleans_feed(self):
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_entry_ids(self.user, self.author), set())
+        self.assertEqual(self.get_feed_ids(self.client), [])
+
+    def test_new_recipe_fanned_out(self):
+        recipe = self.create_recipe(self.author)
+        self.assertIn(recipe.pk, self.get_entry_ids(self.user, self.author))
+        self.assertEqual(
+            self.get_feed_ids(self.client)[0], recipe.pk
+        )
+
+    def test_popular_author_read_on_request(self):
+        self.follow(self.user, self.other_author)
+        self.follow(self.author, self.other_author)
+        recipe = self.create_recipe(self.other_author)
+        self.assertNotIn(
+            recipe.pk, self.get_entry_ids(self.user, self.other_author)
+        )
+        feed = self.get_feed_ids(self.client)
+        self.assertIn(recipe.pk, feed)
+        self.assertEqual(feed, self.get_expected_ids(self.user))
+
+    def test_author_stops_being_popular(self):
+        self.follow(self.user, self.other_author)
+        self.follow(self.author, self.other_author)
+        self.create_recipe(self.other_author)
+        follow = Follow.objects.get(user=self.author, author=self.other_author)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        # все рецепты автора теперь в ленте оставшегося подписчика
+        self.assertEqual(
+            self.get_entry_ids(self.user, self.other_author),
+            set(Recipe.objects.filter(
+                author=self.other_author
+            ).values_list('id', flat=True))
+        )
+        self.assertEqual(
+            self.get_feed_ids(self.client), self.get_expected_ids(self.user)
+        )
+
+    def test_reconcile_refills_feeds(self):
+        # счётчик завышен: автор считался популярным, рецепт не разложен
+        User.objects.filter(pk=self.author.pk).update(followers_count=5)
+        recipe = self.create_recipe(self.author)
+        self.assertNotIn(recipe.pk, self.get_entry_ids(self.user, self.author))
+        reconcile_counters()
+        self.assertIn(recipe.pk, self.get_entry_ids(self.user, self.author))
+        self.assertEqual(
+            self.get_feed_ids(self.client), self.get_expected_ids(self.user)
+        )
+
+    def test_reconcile_drops_entries_of_popular_author(self):
+        self.follow(self.author, self.other_author)
+        # второй подписчик записан в обход сигналов, счётчик занижен
+        Follow.objects.bulk_create(
+            [Follow(user=self.user, author=self.other_author)]
+        )
+        self.assertTrue(self.get_entry_ids(self.author, self.other_author))
+        reconcile_counters()
+        self.assertEqual(
+            self.get_entry_ids(self.author, self.other_author), set()
+        )
+        self.assertEqual(
+            self.get_feed_ids(self.client), self.get_expected_ids(self.user)
+        )
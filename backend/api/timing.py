@@ -0,0 +1,127 @@
+"""Метрики запроса: число SQL-запросов, время в БД, в сериализаторах и общее.
+
+ServerTimingMiddleware считает их для каждого запроса и пишет в
+лог 'api.timing' запросы дольше SLOW_REQUEST_MS миллисекунд или
+с числом SQL-запросов больше SLOW_REQUEST_QUERIES. Заголовок
+Server-Timing (видно во вкладке Network браузера) получают только
+сотрудники (is_staff) и все при DEBUG: остальным незачем знать число
+запросов к БД.
+Время сериализаторов измеряется в списках (BatchListSerializer) и
+в рецептах (RecipeReadSerializer), то есть в ответах, где сериализация
+заметна, и включает SQL-запросы, сделанные при сериализации.
+У потоковых ответов (список покупок) учитывается только время до
+начала отправки тела.
+"""
+import logging
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Counters of one request, durations in seconds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper of DB connections, see execute_wrapper()."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+
+
+class TimedSerializerMixin:
+    """Add to request timings the time of outermost to_representation.
+
+    Nested serializers and items of a list are not counted twice.
+    """
+
+    def to_representation(self, instance):
+        timings = current_timings.get()
+        if timings is None or timings.serializing:
+            return super().to_representation(instance)
+        timings.serializing = True
+        start = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializing = False
+            timings.serializer_time += perf_counter() - start
+
+
+def show_server_timing(request):
+    """Return whether the request may see its metrics in the header.
+
+    DRF authentication sets request.user of the Django request too.
+    """
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def get_server_timing(timings, total_time):
+    return (
+        f'db;dur={timings.db_time * 1000:.1f};'
+        f'desc="{timings.queries} queries", '
+        f'serializer;dur={timings.serializer_time * 1000:.1f}, '
+        f'total;dur={total_time * 1000:.1f}'
+    )
+
+
+class ServerTimingMiddleware:
+    """Measure request, log slow endpoints, add Server-Timing header
+    for staff.
+
+    Should be the first in MIDDLEWARE to measure the whole request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING_ENABLED:
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total_time = perf_counter() - start
+        if show_server_timing(request):
+            response['Server-Timing'] = get_server_timing(
+                timings, total_time
+            )
+        if (
+            total_time * 1000 > settings.SLOW_REQUEST_MS
+            or timings.queries > settings.SLOW_REQUEST_QUERIES
+        ):
+            match = request.resolver_match
+            logger.warning(
+                'Медленный запрос %s %s (%s): статус %d, %.1f мс, '
+                'SQL-запросов %d, БД %.1f мс, сериализаторы %.1f мс',
+                request.method, request.get_full_path(),
+                match.view_name if match else '-', response.status_code,
+                total_time * 1000, timings.queries,
+                timings.db_time * 1000, timings.serializer_time * 1000,
+            )
+        return response
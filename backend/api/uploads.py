@@ -0,0 +1,421 @@
+"""Загрузка картинок рецептов с ограниченным расходом памяти.
+
+Картинка рецепта принимается тремя способами:
+- JSON с base64 в поле 'image' (как раньше). StreamingJSONImageParser
+  читает тело кусками и декодирует base64 сразу во временный файл,
+  в памяти остаётся только JSON без картинки;
+- multipart/form-data с файлом в части 'image', 'ingredients' и 'tags'
+  передаются строками JSON;
+- PUT /api/recipes/{id}/image/ с картинкой в теле запроса как есть
+  (Content-Type: image/jpeg и т.п.).
+Во всех случаях файл пишется на диск по мере чтения, размер проверяется
+на каждом куске (RECIPE_IMAGE_MAX_SIZE), размер в пикселях
+(RECIPE_IMAGE_MAX_PIXELS) - по заголовку картинки до её декодирования.
+"""
+import binascii
+import codecs
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import (
+    DataAndFiles, FileUploadParser, JSONParser, MultiPartParser,
+)
+from rest_framework.utils import json
+
+CHUNK_SIZE = 64 * 1024
+# JSON без картинки: название, описание, ингредиенты, теги
+MAX_JSON_SIZE = 1024 * 1024
+# 'data:image/png;base64,' перед base64
+MAX_DATA_URL_HEADER = 256
+BASE64_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+INVALID_BASE64_MESSAGE = 'Ошибка: картинка не в формате base64.'
+JSON_STRING_STOP = re.compile(r'["\\]')
+UNICODE_ESCAPE = re.compile(r'u[0-9a-fA-F]{4}')
+
+
+class ImageTooLarge(APIException):
+    status_code = 413
+    default_code = 'image_too_large'
+
+    def __init__(self):
+        super().__init__(
+            'Ошибка: размер картинки больше '
+            f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ.'
+        )
+
+
+def check_content_length(request, max_size):
+    """Reject request by Content-Length before reading the body."""
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_size + MAX_JSON_SIZE:
+        raise ImageTooLarge()
+
+
+class Base64FileDecoder:
+    """Decode base64 text fed by chunks into a temporary file."""
+
+    def __init__(self, content_type=None):
+        self.file = TemporaryUploadedFile(
+            'image', content_type, 0, None
+        )
+        self.tail = ''
+
+    def feed(self, text):
+        text = self.tail + text.translate(BASE64_WHITESPACE)
+        usable = len(text) - len(text) % 4
+        self.tail = text[usable:]
+        self.write(text[:usable])
+
+    def write(self, text):
+        try:
+            data = binascii.a2b_base64(text)
+        except binascii.Error:
+            self.file.close()
+            raise serializers.ValidationError(INVALID_BASE64_MESSAGE)
+        self.file.size += len(data)
+        if self.file.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise ImageTooLarge()
+        self.file.write(data)
+
+    def finish(self):
+        if self.tail:
+            self.write(self.tail)
+        self.file.seek(0)
+        return self.file
+
+
+class JSONImageScanner:
+    """Split JSON text fed by chunks into JSON without image and image file.
+
+    The string value of top-level 'key' is replaced by "" in the text and
+    decoded from base64 (optionally with data URL header) to a file.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.parts = []
+        self.size = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.image_escape = None
+        self.string = None
+        self.expect_key = False
+        self.last_key = None
+        self.image_next = False
+        self.image_header = None
+        self.decoder = None
+        self.image = None
+
+    def feed(self, text):
+        position = 0
+        while position < len(text):
+            if self.image_header is not None or self.decoder is not None:
+                position = self.feed_image(text, position)
+            else:
+                position = self.feed_json(text, position)
+
+    def get_text(self):
+        if self.in_image:
+            raise ParseError('JSON parse error - unterminated string')
+        return ''.join(self.parts)
+
+    @property
+    def in_image(self):
+        return self.image_header is not None or self.decoder is not None
+
+    def append(self, text):
+        self.size += len(text)
+        if self.size > MAX_JSON_SIZE:
+            raise ParseError('Ошибка: слишком большой JSON.')
+        self.parts.append(text)
+
+    def feed_json(self, text, start):
+        """Copy JSON text until the image string, return stop position."""
+        for position in range(start, len(text)):
+            char = text[position]
+            if self.in_string:
+                self.scan_string(char)
+                continue
+            if self.image_next and char == '"':
+                self.image_next = False
+                self.image_header = ''
+                self.append(text[start:position + 1])
+                return position + 1
+            self.scan_structure(char)
+        self.append(text[start:])
+        return len(text)
+
+    def scan_string(self, char):
+        if self.escape:
+            self.escape = False
+        elif char == '\\':
+            self.escape = True
+        elif char == '"':
+            self.in_string = False
+            if self.string is not None:
+                # ключ сравнивается после разбора экранирования
+                self.last_key = json.loads('"%s"' % ''.join(self.string))
+                self.string = None
+            return
+        if self.string is not None:
+            self.string.append(char)
+
+    def scan_structure(self, char):
+        """Track nesting and keys of top-level object."""
+        if char in ' \t\r\n':
+            return
+        self.image_next = False
+        if char == '"':
+            self.in_string = True
+            if self.depth == 1 and self.expect_key:
+                self.string = []
+                self.expect_key = False
+        elif char in '{[':
+            self.depth += 1
+            self.expect_key = self.depth == 1 and char == '{'
+        elif char in '}]':
+            self.depth -= 1
+        elif char == ',' and self.depth == 1:
+            self.expect_key = True
+        elif char == ':' and self.depth == 1:
+            self.image_next = self.last_key == self.key
+
+    def feed_image(self, text, position):
+        """Pass image string content to decoder, return stop position."""
+        if self.image_escape is not None:
+            return self.feed_escape(text, position)
+        match = JSON_STRING_STOP.search(text, position)
+        end = match.start() if match else len(text)
+        self.put_image(text[position:end])
+        if match is None:
+            return end
+        if text[end] == '"':
+            self.finish_image()
+            self.append('"')
+            return end + 1
+        self.image_escape = ''
+        return end + 1
+
+    def feed_escape(self, text, position):
+        """Collect escape sequence, which may be split between chunks."""
+        size = 5 if (self.image_escape or text[position])[0] == 'u' else 1
+        end = position + size - len(self.image_escape)
+        self.image_escape += text[position:end]
+        if self.image_escape[0] == 'u' and len(self.image_escape) < 5:
+            return len(text)
+        self.put_image(self.unescape(self.image_escape))
+        self.image_escape = None
+        return end
+
+    def unescape(self, sequence):
+        # в base64 экранирование допустимо только для '/', переводов строк
+        # и символов в виде \uXXXX
+        if sequence == '/':
+            return '/'
+        if sequence in ('n', 'r', 't'):
+            return ''
+        if UNICODE_ESCAPE.fullmatch(sequence):
+            return chr(int(sequence[1:], 16))
+        raise serializers.ValidationError(INVALID_BASE64_MESSAGE)
+
+    def put_image(self, text):
+        if self.decoder is not None:
+            self.decoder.feed(text)
+            return
+        self.image_header += text
+        comma = self.image_header.find(',')
+        if comma >= 0:
+            header, data = (
+                self.image_header[:comma], self.image_header[comma + 1:]
+            )
+            if not header.startswith('data:') or ';base64' not in header:
+                raise serializers.ValidationError(INVALID_BASE64_MESSAGE)
+            self.start_decoder(header[5:].split(';')[0], data)
+        elif len(self.image_header) > MAX_DATA_URL_HEADER:
+            self.start_decoder(None, self.image_header)
+
+    def start_decoder(self, content_type, data):
+        self.image_header = None
+        self.decoder = Base64FileDecoder(content_type)
+        self.decoder.feed(data)
+
+    def finish_image(self):
+        if self.image_header:
+            self.start_decoder(None, self.image_header)
+        if self.decoder is not None:
+            self.image = self.decoder.finish()
+        self.image_header = self.decoder = None
+
+
+def close_after_response(parser_context, file):
+    """Remember temporary file to close, see CloseUploadedFilesMixin."""
+    request = parser_context.get('request')
+    if request is not None:
+        request.uploaded_files = [
+            *getattr(request, 'uploaded_files', ()), file
+        ]
+
+
+class CloseUploadedFilesMixin:
+    """Close temporary files of parsers when the response is ready.
+
+    Django closes only files of form requests, DRF does the same.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        for file in getattr(request, 'uploaded_files', ()):
+            file.close()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class StreamingJSONImageParser(JSONParser):
+    """JSON parser which decodes base64 'image' to a temporary file.
+
+    Peak memory does not depend on the image size.
+    """
+    image_key = 'image'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context.get('request')
+        if request is not None:
+            check_content_length(
+                request, settings.RECIPE_IMAGE_MAX_SIZE * 4 // 3
+            )
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        scanner = JSONImageScanner(self.image_key)
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                scanner.feed(decoder.decode(chunk, final=not chunk))
+                if not chunk:
+                    break
+            data = json.loads(
+                scanner.get_text(),
+                parse_constant=json.strict_constant if self.strict else None
+            )
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({self.image_key: exc.detail})
+        if scanner.image is not None:
+            close_after_response(parser_context, scanner.image)
+            if isinstance(data, dict):
+                data[self.image_key] = scanner.image
+        return data
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Write uploaded files to disk, stop at RECIPE_IMAGE_MAX_SIZE."""
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise ImageTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def use_limited_upload_handler(parser_context):
+    request = parser_context['request']
+    check_content_length(request, settings.RECIPE_IMAGE_MAX_SIZE)
+    request.upload_handlers = [LimitedUploadHandler(request._request)]
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """multipart/form-data with 'ingredients' and 'tags' as JSON strings."""
+    json_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        use_limited_upload_handler(parser_context)
+        result = super().parse(stream, media_type, parser_context)
+        data = result.data.dict()
+        for name in self.json_fields:
+            if name in data:
+                try:
+                    data[name] = json.loads(data[name])
+                except ValueError:
+                    raise ParseError(f'Ошибка: поле {name} не в формате JSON.')
+        return DataAndFiles(data, result.files)
+
+
+class ImageUploadParser(FileUploadParser):
+    """Raw image in request body, returned as request.data['file']."""
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        use_limited_upload_handler(parser_context)
+        result = super().parse(stream, media_type, parser_context)
+        close_after_response(parser_context, result.files['file'])
+        return result
+
+    def get_filename(self, stream, media_type, parser_context):
+        # имя файла генерируется при проверке картинки
+        return 'image'
+
+
+def decode_base64_image(text):
+    """Return temporary file from base64 string, maybe data URL."""
+    if len(text) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ImageTooLarge()
+    content_type = None
+    header, separator, data = text.partition(';base64,')
+    if separator:
+        content_type = header.replace('data:', '')
+        text = data
+    decoder = Base64FileDecoder(content_type)
+    decoder.feed(text)
+    return decoder.finish()
+
+
+class RecipeImageField(serializers.ImageField):
+    """Image from base64 string or uploaded file, with size limits.
+
+    Only the header of the image is decoded to check its pixel size.
+    """
+    FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+    INVALID_IMAGE_MESSAGE = (
+        'Ошибка: загрузите картинку JPEG, PNG, GIF или WebP.'
+    )
+
+    def to_internal_value(self, data):
+        if data in (None, ''):
+            return None
+        if isinstance(data, list) and len(data) == 1:
+            # RecipeMultiPartParser отдаёт dict, DRF добавляет в него
+            # файлы из MultiValueDict списками
+            data = data[0]
+        if isinstance(data, str):
+            data = decode_base64_image(data)
+        if not hasattr(data, 'read'):
+            raise serializers.ValidationError(self.INVALID_IMAGE_MESSAGE)
+        if data.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ImageTooLarge()
+        try:
+            with Image.open(data) as image:
+                width, height = image.size
+                image_format = image.format
+        except Exception:
+            raise serializers.ValidationError(self.INVALID_IMAGE_MESSAGE)
+        finally:
+            data.seek(0)
+        if image_format not in self.FORMATS:
+            raise serializers.ValidationError(self.INVALID_IMAGE_MESSAGE)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                'Ошибка: картинка больше '
+                f'{settings.RECIPE_IMAGE_MAX_PIXELS} пикселей.'
+            )
+        data.name = f'{uuid.uuid4()}.{self.FORMATS[image_format]}'
+        return super().to_internal_value(data)
@@ -1,24 +1,44 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 from logic.models import Basket, FavourRecipe, Follow
-from recipes.models import Component, Product, Recipe, Tag
+from recipes.models import Product, Recipe, Tag
 from users.models import CustomUser as User
+from .autocomplete import normalize_name, product_index, serialize_catalogue
+from .cache import product_catalogue
+from .exporters import SHOPPING_LIST_EXPORTERS
 from .filters import ProductSearchFilter, RecipeQueryParamFilter
-from .paginations import PageLimitNumberPagination
+from .matching import recipe_matcher
+from .negotiation import IgnoreFormatContentNegotiation
+from .paginations import FeedPagination, PageOrKeysetPagination
 from .permissions import AuthorOrReadOnly
+from .querysets import (
+    SUBSCRIPTIONS_ORDERING, get_recipes_read_queryset,
+    get_subscriptions_queryset,
+)
+from .recipe_cache import (
+    get_cache_key, get_data_tags, get_list_tags, recipe_responses,
+    remember_fragment_writes,
+)
 from .serializers import (
-    CustomUserSerializer, ProductSerializer, RecipeReadSerializer,
-    RecipeWriteSerializer, SubscribeSerializer, TagSerializer,
+    CustomUserSerializer, ProductSerializer, RecipeMatchSerializer,
+    RecipeReadSerializer, RecipeWriteSerializer, SubscribeSerializer,
+    TagSerializer,
+)
+from .uploads import (
+    CloseUploadedFilesMixin, ImageUploadParser, RecipeMultiPartParser,
+    StreamingJSONImageParser,
 )
 
 
@@ -45,7 +65,12 @@ class ProductViewSet(ReadOnlyModelViewSet):
     Permissions: IsAuthenticatedOrReadOnly from global settings.
     Pagination: None.
     Model: recipes.Product.
-    Search field 'name'.
+    Search field 'name': served from in-memory index api.autocomplete,
+    prefix matches first, then substring matches, capped by
+    settings.INGREDIENTS_SEARCH_LIMIT.
+    Cache: serialized catalogue in the shared cache, search results in
+    the process memory only, see api.cache.
+    Supports ETag/If-None-Match.
     Allowed http methods/action:
     GET -list       guest
     GET -detail     guest
@@ -58,8 +83,29 @@ class ProductViewSet(ReadOnlyModelViewSet):
     http_method_names = ('get',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = normalize_name(
+            request.query_params.get(ProductSearchFilter.search_param, '')
+        )
+        # значения name приходят от клиентов и не ограничены,
+        # в общий кеш попадает только каталог целиком
+        etag, data = product_catalogue.get_or_build(
+            name, lambda: self.search_products(name), shared=not name
+        )
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def search_products(self, name):
+        if not name:
+            return serialize_catalogue()
+        return product_index.search(name)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CloseUploadedFilesMixin, viewsets.ModelViewSet):
     """Endpoint '/api/recipes/' view.
 
     Permissions: AuthorOrReadOnly custom.
@@ -73,10 +119,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
     Extra-endpoints allowed only auth-user:
     /api/recipes/{id}/shopping_cart/        methods:    get, delete
     /api/recipes/download_shopping_cart/    methods:    get
+        ?format=txt|csv|pdf
     /api/recipes/{id}/favorite/             methods:    get, delete
+    /api/recipes/feed/                      methods:    get
+    Extra-endpoints allowed only to author:
+    /api/recipes/{id}/image/                methods:    put
+        raw image body, Content-Type: image/jpeg|png|gif|webp
+    Extra-endpoints allowed to guest:
+    /api/recipes/match/                     methods:    get
+        ?products=1,2,3&max_missing=2
+    /api/recipes/trending/                  methods:    get
+    List pagination: '?page=N' by default, '?pagination=cursor' for
+    keyset pagination by ('-pub_date', '-id'), '?count=approximate'.
+    '?search=' results are ordered by rank, '?ordering=popular|trending'
+    by precomputed scores, both are paginated by page number.
+    Write: JSON with base64 'image' or multipart/form-data with 'image'
+    file and JSON strings 'ingredients' and 'tags', see api.uploads.
+    Cache: list and detail responses to guests, see api.recipe_cache.
+    Supports ETag/If-None-Match.
     """
     permission_classes = (AuthorOrReadOnly, )
-    pagination_class = PageLimitNumberPagination
+    pagination_class = PageOrKeysetPagination
+    parser_classes = (StreamingJSONImageParser, RecipeMultiPartParser)
     queryset = Recipe.objects.all()
     # serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend, )
@@ -84,6 +148,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     http_method_names = ('get', 'post', 'put', 'patch', 'delete', )
 
+    @property
+    def keyset_ordering(self):
+        # ранжированную выдачу нельзя листать по дате
+        params = self.request.query_params
+        if self.action != 'list' or 'search' in params or (
+            'ordering' in params
+        ):
+            return None
+        return ('-pub_date', '-id')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # до чтения рецептов, см. RecipeReadSerializer.save_fragments
+        remember_fragment_writes(request)
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'trending', 'feed'):
+            return get_recipes_read_queryset(self.request.user)
+        return super().get_queryset()
+
+    def get_read_instance(self, instance):
+        """Reload written recipe with all data for RecipeReadSerializer."""
+        return get_recipes_read_queryset(self.request.user).get(
+            pk=instance.pk
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -93,12 +183,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             return RecipeWriteSerializer
 
+    def get_cached_response(self, get_tags, build):
+        """Return guest response from api.recipe_cache, build() on a miss."""
+        key = get_cache_key(self.request, self.action, self.kwargs.get('pk'))
+        if key is None:
+            return build()
+
+        def builder():
+            data = build().data
+            recipes = data['results'] if self.action == 'list' else [data]
+            return data, get_data_tags(recipes)
+
+        etag, data = recipe_responses.get_or_build(key, get_tags, builder)
+        if etag in parse_etags(self.request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            lambda: get_list_tags(request.query_params),
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            lambda: [f'recipe:{kwargs["pk"]}'],
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         serializer = RecipeReadSerializer(
-            instance=serializer.instance,
+            instance=self.get_read_instance(serializer.instance),
             context={'request': self.request}
         )
         # headers = self.get_success_headers(serializer.data)
@@ -115,13 +238,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         serializer = RecipeReadSerializer(
-            instance=serializer.instance,
+            instance=self.get_read_instance(serializer.instance),
             context={'request': self.request},
         )
         return Response(
             serializer.data, status=HTTP_200_OK
         )
 
+    @action(
+        detail=True, methods=('put',),
+        url_path='image', url_name='image',
+        parser_classes=(ImageUploadParser,),
+    )
+    def upload_image(self, request, pk=None):
+        """Replace recipe image by image in request body."""
+        serializer = RecipeWriteSerializer(
+            self.get_object(), data={'image': request.data.get('file')},
+            partial=True, context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        serializer = RecipeReadSerializer(
+            instance=self.get_read_instance(serializer.instance),
+            context={'request': self.request},
+        )
+        return Response(serializer.data, status=HTTP_200_OK)
+
     def add_recipe(self, request, model, pk=None):
         """Add recipe into favorites or basket of current user.
 
@@ -176,37 +318,129 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.del_recipe(request, FavourRecipe, pk)
         return None
 
+    @action(
+        detail=False, methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+        url_path='feed', url_name='feed',
+    )
+    def feed(self, request):
+        """Return recipes of authors followed by user, newest first.
+
+        Keyset paginated, page of any size costs a constant number of
+        queries, see logic.feed.
+        """
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False, methods=('get',),
+        url_path='trending', url_name='trending',
+    )
+    def trending(self, request):
+        """Return recipes gaining popularity now, best first.
+
+        Scores are precomputed by logic.scores, list filters apply.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            score__trending__gt=0
+        ).order_by('-score__trending', '-pub_date', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False, methods=('get',),
+        url_path='match', url_name='match',
+    )
+    def match(self, request):
+        """Return recipes which can be cooked from given products.
+
+        '?products=' - product ids, comma separated or repeated.
+        '?max_missing=' - how many recipe's products may be missing,
+        default 2. Recipes are matched in memory by api.matching, best
+        first. Page of any size costs the same queries as recipes list.
+        """
+        product_ids = self.get_int_params('products')
+        max_missing = self.get_int_params('max_missing') or [2]
+        if not product_ids:
+            raise ValidationError({
+                'products': 'Ошибка: укажите id продуктов.'
+            })
+        matches = self.paginate_queryset(
+            recipe_matcher.match(product_ids, max_missing[0])
+        )
+        recipes = get_recipes_read_queryset(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        page = []
+        for recipe_id, matched, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched, recipe.missing = matched, missing
+                page.append(recipe)
+        serializer = RecipeMatchSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def get_int_params(self, name):
+        """Return query param values as non-negative ints.
+
+        Values may be repeated or comma separated.
+        """
+        try:
+            values = [
+                int(value)
+                for param in self.request.query_params.getlist(name)
+                for value in param.split(',') if value
+            ]
+        except ValueError:
+            values = [-1]
+        if any(value < 0 for value in values):
+            raise ValidationError({
+                name: 'Ожидается целое неотрицательное число.'
+            })
+        return values
+
     @action(
         detail=False, methods=('get',),
         permission_classes=(IsAuthenticated,),
         url_path='download_shopping_cart', url_name='txt_basket',
+        content_negotiation_class=IgnoreFormatContentNegotiation,
     )
-    def download_text_file(self, request):
-        """Make and response txt-file from current user's basket."""
+    def download_shopping_cart(self, request):
+        """Stream file from current user's basket.
+
+        File format from '?format=': txt(default), csv, pdf.
+        """
+        export_format = request.query_params.get('format', 'txt')
+        exporter = SHOPPING_LIST_EXPORTERS.get(export_format)
+        if exporter is None:
+            return Response({
+                'errors': 'Ошибка. Допустимые форматы списка покупок: '
+                          f'{", ".join(SHOPPING_LIST_EXPORTERS)}.'
+            }, status=status.HTTP_400_BAD_REQUEST)
         user = request.user
         if not user.basket.exists():
             return Response({
                 'errors': 'Ошибка. Попытка получения пустого списка покупок.'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        basket_components = Component.objects.filter(
-            recipe__basket_recipes__user=user
-        ).values(
-            'product__name',
-            'product__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('product__name')
+        basket_components = user.shopping_list.values(
+            'amount',
+            name=F('product__name'),
+            measurement_unit=F('product__measurement_unit'),
+        ).order_by('name')
 
-        response = HttpResponse(content_type='text/plain')
+        response = StreamingHttpResponse(
+            exporter.stream(basket_components.iterator()),
+            content_type=exporter.media_type,
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{exporter.format}"'
         )
-        response.write('Список продуктов к покупке\r\n\r\n')
-        for component in basket_components:
-            response.write(
-                f'* {component["product__name"]} - '
-                f'{component["amount"]} '
-                f'{component["product__measurement_unit"]} \r\n'
-            )
         return response
 
 
@@ -229,7 +463,9 @@ class CustomUserViewSet(UserViewSet):
     """
     queryset = User.objects.all().prefetch_related('recipes')
     serializer_class = CustomUserSerializer
-    pagination_class = PageLimitNumberPagination
+    pagination_class = PageOrKeysetPagination
+    # keyset pagination is enabled per action
+    keyset_ordering = None
     http_method_names = ('get', 'post', 'delete')
     lookup_field = 'pk'
     lookup_value_regex = '[0-9]'
@@ -238,12 +474,19 @@ class CustomUserViewSet(UserViewSet):
         detail=False, methods=('get', ),
         url_path='subscriptions', url_name='subscriptions',
         permission_classes=(IsAuthenticated, ),
-        serializer_class=SubscribeSerializer
+        serializer_class=SubscribeSerializer,
+        keyset_ordering=SUBSCRIPTIONS_ORDERING,
     )
     def get_subscriptions(self, request):
-        """Get and return current user's subscriptions."""
-        user = request.user
-        queryset = Follow.objects.filter(user=user)
+        """Get and return current user's subscriptions.
+
+        Page of any size costs 3 queries: count, follows with authors,
+        authors' recipes limited by 'recipes_limit'.
+        With '?pagination=cursor' there is no count query.
+        """
+        queryset = get_subscriptions_queryset(
+            request.user, self.get_recipes_limit()
+        )
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
@@ -252,6 +495,21 @@ class CustomUserViewSet(UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self):
+        """Return 'recipes_limit' query param as int or None."""
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError({
+                'recipes_limit': 'Ожидается целое неотрицательное число.'
+            })
+        return recipes_limit
+
     @action(
         detail=True, methods=('post', 'delete'),
         url_path='subscribe',
@@ -272,6 +530,7 @@ class CustomUserViewSet(UserViewSet):
 
         Before add need check obj exist and exist in subscriptions.
         """
+        recipes_limit = self.get_recipes_limit()
         author = get_object_or_404(User, pk=pk)
         user = request.user
         if user == author:
@@ -281,9 +540,10 @@ class CustomUserViewSet(UserViewSet):
 
         follow, _ = Follow.objects.get_or_create(user=user, author=author)
         if _:
-            serializer = SubscribeSerializer(
-                follow, context={'request': request}
-            )
+            serializer = SubscribeSerializer(follow, context={
+                'request': request,
+                'recipes_limit': recipes_limit,
+            })
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response({
             'errors': 'Ошибка. Попытка повторной подписки на автора.'
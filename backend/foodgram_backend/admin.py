@@ -0,0 +1,18 @@
+"""Общие классы админки приложений проекта."""
+
+
+class ChangedFieldsAdminMixin:
+    """Save only changed fields of edited object.
+
+    Full save() would overwrite fields written by F() updates, such as
+    counters of logic.counters, with values loaded into the form.
+    """
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.save()
+            return
+        fields = {field.name for field in obj._meta.concrete_fields}
+        update_fields = [name for name in form.changed_data if name in fields]
+        if update_fields:
+            obj.save(update_fields=update_fields)
@@ -22,12 +22,14 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
+    'api.apps.SimpleAdminConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'logic.apps.LogicConfig',
 ]
 
 MIDDLEWARE = [
+    'api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +82,86 @@ DATABASES = {
     }
 }
 
+# кеш должен быть общим для всех процессов backend (в docker-compose -
+# memcached), иначе сброс кеша при записи виден только в своём процессе
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# каталог ингредиентов: время жизни в общем кеше в секундах и размер
+# кеша ответов поиска в памяти процесса
+INGREDIENTS_CACHE_TIMEOUT = 24 * 60 * 60
+INGREDIENTS_CACHE_MAX_LOCAL_ENTRIES = 1024
+# кеш ответов списка и страницы рецепта для гостей (api.recipe_cache):
+# записи сбрасываются по тегам при записи, время жизни в секундах
+# ограничивает устаревание при гонке чтения с записью
+RECIPE_RESPONSE_CACHE_ENABLED = True
+RECIPE_RESPONSE_CACHE_TIMEOUT = 300
+# кеш сериализованных рецептов без полей пользователя для всех запросов
+# (api.recipe_cache), сбрасывается по тем же тегам
+RECIPE_FRAGMENT_CACHE_ENABLED = True
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 600
+# индекс 'что приготовить' (api.matching) после изменения ингредиентов
+# перестраивается в фоне, до конца перестроения отдаётся прежний
+RECIPE_MATCHER_BACKGROUND_REBUILD = True
+# максимум подсказок в ответе на /api/ingredients/?name=
+INGREDIENTS_SEARCH_LIMIT = 50
+# рейтинги рецептов (logic.scores): веса добавления в избранное и в
+# корзину, период полураспада вклада для 'popular' и 'trending' в днях,
+# за сколько дней учитываются события в 'trending'
+RECIPE_SCORE_FAVORITE_WEIGHT = 1.0
+RECIPE_SCORE_BASKET_WEIGHT = 2.0
+RECIPE_POPULAR_HALF_LIFE_DAYS = 30
+RECIPE_TRENDING_HALF_LIFE_DAYS = 1
+RECIPE_TRENDING_WINDOW_DAYS = 7
+# ленты подписок (logic.feed): рецепты авторов с большим числом
+# подписчиков не раскладываются по лентам, а читаются при запросе;
+# сколько последних рецептов автора добавить в ленту при подписке
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_BACKFILL_RECIPES = 50
+
+# уменьшенные копии картинок рецептов (recipes.images): число фоновых
+# потоков на процесс (0 - обработка сразу после коммита в потоке
+# запроса) и качество сжатия WebP/JPEG
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_QUALITY = 80
+# ограничения загружаемой картинки рецепта (api.uploads): размер файла
+# в байтах и в пикселях
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+# метрики запросов (api.timing): заголовок Server-Timing для сотрудников
+# и при DEBUG; запросы дольше SLOW_REQUEST_MS миллисекунд или с числом
+# SQL-запросов больше SLOW_REQUEST_QUERIES пишутся в лог 'api.timing'
+SERVER_TIMING_ENABLED = (
+    os.environ.get('SERVER_TIMING_ENABLED', 'True').upper() == 'TRUE'
+)
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', default=500))
+SLOW_REQUEST_QUERIES = int(
+    os.environ.get('SLOW_REQUEST_QUERIES', default=20)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'recipes': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -120,6 +202,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 #     os.path.join(BASE_DIR, 'staticfiles'),
 # ]
 
+# шрифт с кириллицей для PDF-списка покупок
+SHOPPING_LIST_PDF_FONT = os.environ.get(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -1,7 +1,18 @@
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, connection
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_wsgi_application()
+
+# построить индекс ингредиентов до первого запроса
+from api.autocomplete import product_index  # noqa: E402
+
+try:
+    product_index.build()
+except DatabaseError:
+    pass
+finally:
+    connection.close()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Basket, FavourRecipe, Follow
+from .models import Basket, FavourRecipe, Follow, RecipeScore, ShoppingListItem
 
 
 @admin.register(Basket)
@@ -30,6 +30,7 @@ class FavourRecipesAdmin(admin.ModelAdmin):
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author', 'folowing_count', 'folower_count')
+    list_select_related = ('user', 'author')
     list_display_links = ('user',)
     list_filter = ('user', 'author')
     fieldsets = (
@@ -37,3 +38,22 @@ class FollowAdmin(admin.ModelAdmin):
     )
     search_fields = ('user__username', 'following__username')
     ordering = ('user', 'author',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'amount')
+    list_display_links = ('user', )
+    list_filter = ('user', )
+    readonly_fields = ('user', 'product', 'amount')
+    search_fields = ('user__username', 'product__name')
+    ordering = ('user', 'product__name')
+
+
+@admin.register(RecipeScore)
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'popular', 'trending', 'updated')
+    list_select_related = ('recipe__author',)
+    readonly_fields = ('recipe', 'popular', 'trending', 'updated')
+    search_fields = ('recipe__title',)
+    ordering = ('-popular',)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LogicConfig(AppConfig):
     name = 'logic'
     verbose_name = '3. Бизнес-логика'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,78 @@
+"""Денормализованные счётчики рецептов и пользователей.
+
+Recipe.favorites_count, Recipe.basket_count, CustomUser.followers_count,
+CustomUser.following_count и CustomUser.recipes_count меняются
+атомарно через F() в сигналах logic.signals при создании и удалении
+записей. Массовые операции в обход сигналов (bulk_create, update(),
+SQL) счётчики не меняют, расхождения исправляет команда
+reconcile_counters, она же поправляет ленты подписок авторов, которых
+неверный счётчик подписчиков относил не к той группе (logic.feed).
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Recipe
+from users.models import CustomUser as User
+from .feed import reconcile_feeds
+from .models import Basket, FavourRecipe, FeedEntry, Follow
+
+# модель со счётчиком, счётчик, считаемая модель, её поле-ссылка
+COUNTERS = (
+    (Recipe, 'favorites_count', FavourRecipe, 'recipe'),
+    (Recipe, 'basket_count', Basket, 'recipe'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'following_count', Follow, 'user'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def change_counters(model, pk, **deltas):
+    """Add deltas to counters of one row by a single UPDATE."""
+    model.objects.filter(pk=pk).update(**{
+        field: Greatest(F(field) + Value(delta), Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def get_actual_count(counted_model, field):
+    """Return expression counting counted_model rows of outer row."""
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile_counters(dry_run=False):
+    """Fix counters which differ from actual counts.
+
+    Feeds of authors whose fixed followers_count crosses
+    FEED_FANOUT_MAX_FOLLOWERS are fixed too, see logic.feed.
+    Return list of (counter label, number of drifted rows).
+    """
+    result, followers_counts = [], []
+    for model, counter, counted_model, field in COUNTERS:
+        drifted = model.objects.annotate(
+            actual_count=get_actual_count(counted_model, field)
+        ).exclude(**{counter: F('actual_count')})
+        if counter == 'followers_count':
+            followers_counts = list(
+                drifted.values_list('pk', counter, 'actual_count')
+            )
+        if dry_run:
+            fixed = drifted.count()
+        else:
+            fixed = model.objects.filter(
+                pk__in=drifted.values('pk')
+            ).update(**{counter: get_actual_count(counted_model, field)})
+        result.append((f'{model._meta.label}.{counter}', fixed))
+    result.append((
+        f'{FeedEntry._meta.label} (авторы)',
+        reconcile_feeds(followers_counts, dry_run),
+    ))
+    return result
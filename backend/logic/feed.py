@@ -0,0 +1,178 @@
+"""Ленты подписок (logic.FeedEntry).
+
+Новый рецепт после коммита раскладывается по лентам подписчиков автора
+одним bulk_create (fan-out on write). Рецепты авторов, у которых больше
+FEED_FANOUT_MAX_FOLLOWERS подписчиков, не раскладываются: при чтении
+ленты они берутся из recipes.Recipe и сливаются с записями ленты
+(fan-out on read). Когда автор перестаёт быть популярным, все его
+рецепты раскладываются по лентам оставшихся подписчиков: при чтении
+они видели их все.
+Подписка добавляет в ленту последние FEED_BACKFILL_RECIPES рецептов
+автора, отписка удаляет их.
+Если счётчик подписчиков разошёлся с данными, рецепты могли быть
+разложены или пропущены не по тому порогу: reconcile_counters после
+исправления счётчика вызывает reconcile_feeds.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Recipe
+from users.models import CustomUser as User
+from .models import FeedEntry, Follow
+
+
+def is_popular(followers_count):
+    return followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out_recipes(recipe_ids):
+    """Add recipes to feeds of their authors' followers.
+
+    Recipes of popular authors are skipped. Costs 2 queries and inserts
+    regardless of the number of recipes.
+    """
+    recipes_by_author = {}
+    for recipe_id, author_id, pub_date in Recipe.objects.filter(
+        pk__in=recipe_ids,
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', 'author_id', 'pub_date'):
+        recipes_by_author.setdefault(author_id, []).append(
+            (recipe_id, pub_date)
+        )
+    if not recipes_by_author:
+        return
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date
+            )
+            for user_id, author_id in Follow.objects.filter(
+                author_id__in=recipes_by_author
+            ).values_list('user_id', 'author_id').iterator()
+            for recipe_id, pub_date in recipes_by_author[author_id]
+        ),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+def schedule_fan_out(recipe_ids):
+    """Fan out recipes after commit, when they are visible to readers."""
+    transaction.on_commit(lambda: fan_out_recipes(recipe_ids))
+
+
+def fill_feeds(author_id, user_ids, limit=None):
+    """Add latest limit recipes of author (all by default) to feeds."""
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')
+    if limit is not None:
+        recipes = recipes[:limit]
+    recipes = list(recipes)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date
+            )
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+def follow_author(user_id, author_id):
+    """Fill user's feed with author's recipes on subscription."""
+    author = User.objects.filter(pk=author_id).values(
+        'followers_count'
+    ).first()
+    if author is not None and not is_popular(author['followers_count']):
+        fill_feeds(author_id, (user_id,), settings.FEED_BACKFILL_RECIPES)
+
+
+def unfollow_author(user_id, author_id):
+    """Clean user's feed on unsubscription.
+
+    If author stops being popular, fill feeds of remaining followers
+    with all author's recipes, they were read on request till now.
+    Must run in the transaction which decremented followers_count.
+    """
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    # строка автора заблокирована уменьшением счётчика до конца
+    # транзакции: параллельные отписки видят счётчик по очереди, и
+    # переход через порог видит ровно одна из них
+    author = User.objects.select_for_update().filter(pk=author_id).values(
+        'followers_count'
+    ).first()
+    if author is not None and (
+        author['followers_count'] == settings.FEED_FANOUT_MAX_FOLLOWERS
+    ):
+        fill_feeds(author_id, Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True))
+
+
+def reconcile_feeds(followers_counts, dry_run=False):
+    """Fix feeds of authors whose followers count crossed the threshold.
+
+    followers_counts - (author id, old count, actual count). Authors who
+    are not popular any more get all recipes in followers' feeds,
+    entries of authors who became popular are read from recipes and
+    deleted. Return number of such authors.
+    """
+    fixed = 0
+    for author_id, old_count, actual_count in followers_counts:
+        if is_popular(old_count) == is_popular(actual_count):
+            continue
+        fixed += 1
+        if dry_run:
+            continue
+        if is_popular(actual_count):
+            FeedEntry.objects.filter(author_id=author_id).delete()
+        else:
+            fill_feeds(author_id, Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True))
+    return fixed
+
+
+def get_keyset_filter(date_field, id_field, descending, after):
+    """Rows strictly after key after=(pub_date, id) in feed order."""
+    pub_date, pk = after
+    lookup = 'lt' if descending else 'gt'
+    return Q(**{f'{date_field}__{lookup}': pub_date}) | Q(**{
+        date_field: pub_date, f'{id_field}__{lookup}': pk
+    })
+
+
+def get_feed_keys(user, descending=True, after=None, limit=10):
+    """Return up to limit (pub_date, recipe id) of user's feed.
+
+    Keys follow key 'after' in order by (pub_date, id), descending or
+    ascending. Costs 3 queries: feed entries, popular followed authors,
+    their recipes.
+    """
+    sign = '-' if descending else ''
+    entries = FeedEntry.objects.filter(user=user)
+    recipes = Recipe.objects.filter(author_id__in=list(
+        Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('author_id', flat=True)
+    ))
+    if after is not None:
+        entries = entries.filter(
+            get_keyset_filter('pub_date', 'recipe_id', descending, after)
+        )
+        recipes = recipes.filter(
+            get_keyset_filter('pub_date', 'id', descending, after)
+        )
+    keys = set(entries.order_by(
+        f'{sign}pub_date', f'{sign}recipe_id'
+    ).values_list('pub_date', 'recipe_id')[:limit])
+    keys.update(recipes.order_by(
+        f'{sign}pub_date', f'{sign}id'
+    ).values_list('pub_date', 'id')[:limit])
+    return sorted(keys, reverse=descending)[:limit]
@@ -0,0 +1,26 @@
+"""Подписки пользователя, нужные при сериализации авторов.
+
+is_subscribed автора считается по множеству id авторов, на которых
+подписан request.user: оно читается одним запросом и хранится на
+запросе, сколько бы пользователей ни было в ответе. Используется
+сериализаторами api и users.
+"""
+from .models import Follow
+
+
+def get_followed_author_ids(request):
+    """Return set of ids of authors followed by request.user.
+
+    Loaded by one query on first call and kept on the django
+    HttpRequest, shared by every rest_framework Request wrapping it.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, 'followed_author_ids'):
+        http_request.followed_author_ids = frozenset(
+            Follow.objects.filter(user=request.user).values_list(
+                'author_id', flat=True
+            )
+        )
+    return http_request.followed_author_ids
@@ -0,0 +1,280 @@
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate, islice
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from logic.counters import reconcile_counters
+from logic.models import Basket, FavourRecipe, Follow
+from logic.scores import update_recipe_scores
+from logic.shopping_list import rebuild_shopping_lists
+from recipes.bulk import bulk_create_recipes
+from recipes.models import Product, Recipe, Tag
+from users.models import CustomUser as User
+
+USERNAME_PREFIX = 'fixture'
+FIXTURE_PASSWORD = 'fixture-password'
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+class ZipfSampler:
+    """Draw items with probability proportional to 1 / rank ** exponent.
+
+    Ranks are assigned to items in random order, so popularity does not
+    follow ids.
+    """
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, k, exclude=None):
+        """Return up to k distinct items, popular ones more likely."""
+        k = min(k, len(self.items) - (exclude is not None))
+        result = set()
+        # с сильной асимметрией повторы часты, число попыток ограничено
+        for _ in range(10):
+            result.update(self.rng.choices(
+                self.items, cum_weights=self.cum_weights,
+                k=k - len(result)
+            ))
+            result.discard(exclude)
+            if len(result) >= k:
+                break
+        return result
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic users, recipes, follows, favorites and '
+            'baskets for load testing. Authors, followed users, '
+            'ingredients and favorite recipes follow Zipf distributions. '
+            'Tags and ingredients must be loaded, see load_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Mean number of follows per user',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Mean number of favorite recipes per user',
+        )
+        parser.add_argument(
+            '--basket', type=int, default=5,
+            help='Mean number of recipes in basket per user',
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Zipf exponent, larger is more skewed',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, same seed on empty DB gives same data',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно не меньше 2 пользователей и 1 рецепта')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        if not self.tag_ids or not product_ids:
+            raise CommandError(
+                'Нет тегов или продуктов, сначала выполните load_data'
+            )
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        self.products = {
+            product_id: name for product_id, name
+            in Product.objects.values_list('id', 'name')
+        }
+        self.product_sampler = ZipfSampler(
+            self.rng, sorted(product_ids), options['exponent']
+        )
+        start = perf_counter()
+        for title, step in (
+            ('Пользователи', self.create_users),
+            ('Подписки', self.create_follows),
+            ('Рецепты', self.create_recipes),
+            ('Избранное и корзины', self.create_favorites),
+            ('Счётчики и рейтинги', self.update_derived),
+        ):
+            step_start = perf_counter()
+            created = step()
+            self.stdout.write(
+                f'{title}: {created} за {perf_counter() - step_start:.2f} с.'
+            )
+        self.stdout.write(
+            f'Всего за {perf_counter() - start:.2f} с. '
+            f'Пароль пользователей: {FIXTURE_PASSWORD}'
+        )
+
+    def get_count(self, mean, maximum):
+        return min(self.rng.randint(0, 2 * mean), maximum)
+
+    def get_past_date(self, days):
+        return self.now - timedelta(
+            seconds=self.rng.random() * days * SECONDS_IN_DAY
+        )
+
+    def create_users(self):
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        # хеширование пароля дорогое, хеш один на всех
+        password = make_password(FIXTURE_PASSWORD)
+        usernames = [
+            f'{USERNAME_PREFIX}{number}'
+            for number in range(start, start + self.options['users'])
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(
+                (
+                    User(
+                        username=username, email=f'{username}@example.com',
+                        first_name='Тест', last_name=username,
+                        password=password,
+                    )
+                    for username in usernames
+                ),
+                batch_size=self.options['batch_size'],
+            )
+            self.user_ids = list(User.objects.filter(
+                username__in=usernames
+            ).order_by('pk').values_list('pk', flat=True))
+            Token.objects.bulk_create(
+                (
+                    Token(user_id=user_id, key=Token.generate_key())
+                    for user_id in self.user_ids
+                ),
+                batch_size=self.options['batch_size'],
+            )
+        return len(self.user_ids)
+
+    def create_follows(self):
+        # подписки создаются до рецептов: ленты заполнит раскладка рецептов
+        authors = ZipfSampler(
+            self.rng, self.user_ids, self.options['exponent']
+        )
+        follows = (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in self.user_ids
+            for author_id in authors.sample(
+                self.get_count(self.options['follows'], len(self.user_ids)),
+                exclude=user_id
+            )
+        )
+        created = 0
+        for batch in batched(follows, self.options['batch_size']):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        # популярность авторов для раскладки по лентам берётся из счётчиков
+        reconcile_counters()
+        return created
+
+    def create_picture(self):
+        """Save one placeholder image shared by all recipes."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+        return Recipe.picture.field.storage.save(
+            Recipe.picture.field.generate_filename(None, 'fixture.png'),
+            ContentFile(buffer.getvalue())
+        )
+
+    def create_recipe(self, author_id, picture):
+        product_ids = self.product_sampler.sample(self.rng.randint(3, 10))
+        names = [self.products[product_id] for product_id in product_ids]
+        title = f'{names[0].capitalize()} с {", ".join(names[1:3])}'
+        recipe = Recipe(
+            author_id=author_id,
+            title=title[:200],
+            text='. '.join(
+                f'Добавить {name} и перемешать' for name in names
+            ),
+            cooking_time=self.rng.randint(5, 180),
+            pub_date=self.get_past_date(365),
+            picture=picture,
+        )
+        tag_ids = self.rng.sample(
+            self.tag_ids, self.rng.randint(1, min(2, len(self.tag_ids)))
+        )
+        components = [
+            (product_id, self.rng.randint(1, 500))
+            for product_id in product_ids
+        ]
+        return recipe, tag_ids, components
+
+    def create_recipes(self):
+        picture = self.create_picture()
+        authors = ZipfSampler(
+            self.rng, self.user_ids, self.options['exponent']
+        )
+        self.recipe_ids = []
+        recipes = (
+            self.create_recipe(authors.choice(), picture)
+            for _ in range(self.options['recipes'])
+        )
+        for batch in batched(recipes, self.options['batch_size']):
+            self.recipe_ids += bulk_create_recipes(batch)
+        return len(self.recipe_ids)
+
+    def create_favorites(self):
+        recipes = ZipfSampler(
+            self.rng, self.recipe_ids, self.options['exponent']
+        )
+        created = 0
+        for model, mean in (
+            (FavourRecipe, self.options['favorites']),
+            (Basket, self.options['basket']),
+        ):
+            rows = (
+                model(
+                    user_id=user_id, recipe_id=recipe_id,
+                    created=self.get_past_date(30)
+                )
+                for user_id in self.user_ids
+                for recipe_id in recipes.sample(
+                    self.get_count(mean, len(self.recipe_ids))
+                )
+            )
+            for batch in batched(rows, self.options['batch_size']):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+        for user_ids in batched(self.user_ids, self.options['batch_size']):
+            rebuild_shopping_lists(user_ids)
+        return created
+
+    def update_derived(self):
+        # bulk_create не посылает сигналы, счётчики пересчитываются здесь
+        fixed = sum(drifted for _, drifted in reconcile_counters())
+        update_recipe_scores()
+        return fixed
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from logic.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Fix denormalized counters of recipes and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report counters which differ from actual counts',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        for label, drifted in reconcile_counters(dry_run=dry_run):
+            action = 'расходится' if dry_run else 'исправлено'
+            self.stdout.write(f'{label}: {action} {drifted} записей.')
@@ -0,0 +1,19 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from logic.scores import update_recipe_scores
+
+
+class Command(BaseCommand):
+    help = ('Recompute popular and trending recipe scores, '
+            'run periodically: the scheduler service of docker-compose '
+            'runs it every SCORES_INTERVAL seconds, see scheduler.sh')
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        scored = update_recipe_scores()
+        self.stdout.write(
+            f'Пересчитаны рейтинги {scored} рецептов '
+            f'за {perf_counter() - start:.2f} с.'
+        )
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.8 on 2026-10-18 01:41
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# модель со счётчиком, счётчик, считаемая модель, её поле-ссылка
+COUNTERS = (
+    (('recipes', 'Recipe'), 'favorites_count',
+     ('logic', 'FavourRecipe'), 'recipe'),
+    (('recipes', 'Recipe'), 'basket_count', ('logic', 'Basket'), 'recipe'),
+    (('users', 'CustomUser'), 'followers_count', ('logic', 'Follow'), 'author'),
+    (('users', 'CustomUser'), 'following_count', ('logic', 'Follow'), 'user'),
+    (('users', 'CustomUser'), 'recipes_count',
+     ('recipes', 'Recipe'), 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, counter, counted_model, field in COUNTERS:
+        counted = apps.get_model(*counted_model).objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+        apps.get_model(*model).objects.update(
+            **{counter: Coalesce(Subquery(counted), Value(0))}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logic', '0005_shoppinglistitem'),
+        ('recipes', '0007_recipe_counters'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
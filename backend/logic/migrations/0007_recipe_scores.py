@@ -0,0 +1,39 @@
+# Generated by Django 3.2.8 on 2026-10-18 01:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+        ('logic', '0006_fill_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(db_index=True, default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(db_index=True, default=0, verbose_name='Популярность за последние дни')),
+                ('updated', models.DateTimeField(verbose_name='Пересчитаны')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+        migrations.AddField(
+            model_name='favourrecipe',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+    ]
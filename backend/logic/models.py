@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.db import models
+from django.utils import timezone
 
-from recipes.models import Recipe
+from recipes.models import Product, Recipe
 from users.models import CustomUser as User
 
 
@@ -11,6 +12,7 @@ class Basket(models.Model):
     Поля:
     user - Пользователь.
     recipes - Рецепты в корзине.
+    created - Когда рецепт добавлен.
     """
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -22,6 +24,10 @@ class Basket(models.Model):
         related_name='basket_recipes',
         verbose_name='Рецепты в списке покупок'
     )
+    created = models.DateTimeField(
+        default=timezone.now, db_index=True,
+        verbose_name='Добавлен'
+    )
 
     class Meta:
         ordering = ('user',)
@@ -84,7 +90,7 @@ class Follow(models.Model):
     )
     def folower_count(self):
         """Сколько имеет подписчиков"""
-        return self.user.following.count()
+        return self.user.followers_count
 
     @property  # type: ignore
     @admin.display(
@@ -92,7 +98,7 @@ class Follow(models.Model):
     )
     def folowing_count(self):
         """На скольких пользователей подписан"""
-        return self.user.follower.count()
+        return self.user.following_count
 
 
 class FavourRecipe(models.Model):
@@ -101,6 +107,7 @@ class FavourRecipe(models.Model):
     Поля:
     user - Пользователь.
     recipe - Избранный рецепт.
+    created - Когда рецепт добавлен.
     """
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -112,6 +119,10 @@ class FavourRecipe(models.Model):
         related_name='favourite',
         verbose_name='Избранные рецепты'
     )
+    created = models.DateTimeField(
+        default=timezone.now, db_index=True,
+        verbose_name='Добавлен'
+    )
 
     class Meta:
         ordering = ('user',)
@@ -135,3 +146,136 @@ class FavourRecipe(models.Model):
     def recipes_count(self):
         """Вернуть количество рецептов в избранном пользователя."""
         return self.user.favour_recipes.count()
+
+
+class ShoppingListItem(models.Model):
+    """Строка списка покупок пользователя.
+
+    Суммарное количество продукта по всем рецептам корзины пользователя.
+    Поддерживается при изменениях корзины и ингредиентов рецептов,
+    см. logic.shopping_list и logic.signals.
+    Поля:
+    user - Пользователь.
+    product - Продукт.
+    amount - Количество продукта к покупке.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Продукт'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество продукта к покупке'
+    )
+
+    class Meta:
+        ordering = ('user',)
+        verbose_name = 'Продукт к покупке'
+        verbose_name_plural = 'Списки продуктов к покупке'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'product',),
+                name='unique_user_product',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user.username}: {self.product} - {self.amount}'
+
+
+class RecipeScore(models.Model):
+    """Рейтинги рецепта.
+
+    Сумма добавлений в избранное и в корзину с весами, вклад каждого
+    добавления затухает со временем. Пересчитываются периодически
+    командой update_recipe_scores, см. logic.scores.
+    Поля:
+    recipe - Рецепт.
+    popular - Популярность, медленное затухание.
+    trending - Популярность за последние дни, быстрое затухание.
+    updated - Когда пересчитаны.
+    """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE,
+        primary_key=True, related_name='score',
+        verbose_name='Рецепт'
+    )
+    popular = models.FloatField(
+        default=0, db_index=True,
+        verbose_name='Популярность'
+    )
+    trending = models.FloatField(
+        default=0, db_index=True,
+        verbose_name='Популярность за последние дни'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Пересчитаны'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular:.2f}, {self.trending:.2f}'
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок пользователя.
+
+    Рецепты авторов, на которых подписан пользователь, раскладываются
+    по лентам подписчиков при публикации, кроме авторов с числом
+    подписчиков больше FEED_FANOUT_MAX_FOLLOWERS: их рецепты
+    добавляются в ленту при чтении, см. logic.feed.
+    Поля:
+    user - Владелец ленты.
+    recipe - Рецепт.
+    author - Автор рецепта.
+    pub_date - Дата публикации рецепта, ключ сортировки ленты.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Владелец ленты'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        ordering = ('user', '-pub_date', '-recipe_id')
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_user_feed_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'), name='feed_user_author_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user.username}: {self.recipe}'
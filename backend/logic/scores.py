@@ -0,0 +1,94 @@
+"""Рейтинги рецептов 'popular' и 'trending' (logic.RecipeScore).
+
+Добавление рецепта в избранное или в корзину даёт рейтингу вклад,
+равный весу из настроек, умноженному на 2 ** (-возраст / период
+полураспада). События группируются в БД по дням для 'popular' и по часам
+за последние RECIPE_TRENDING_WINDOW_DAYS дней для 'trending', пересчёт
+читает по строке на рецепт и интервал, а не на каждое событие.
+Запросы API читают готовую таблицу и избранное с корзинами не агрегируют.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Basket, FavourRecipe, RecipeScore
+
+SECONDS_IN_DAY = 24 * 60 * 60
+
+# Рейтинги всех рецептов пересчитаны.
+# Посылается внутри транзакции записи.
+scores_updated = Signal()
+
+
+def add_decayed_counts(scores, queryset, trunc, bucket, weight, half_life,
+                       now):
+    """Add decayed weighted counts of queryset rows to scores by recipe.
+
+    Rows are counted by time buckets, age of a bucket is taken at its
+    middle.
+    """
+    counts = queryset.annotate(
+        bucket_start=trunc('created')
+    ).values('recipe_id', 'bucket_start').annotate(
+        total=Count('pk')
+    ).order_by()
+    for row in counts.iterator():
+        age = now - row['bucket_start'] - bucket / 2
+        age_days = max(age.total_seconds(), 0) / SECONDS_IN_DAY
+        scores[row['recipe_id']] += (
+            weight * row['total'] * 0.5 ** (age_days / half_life)
+        )
+
+
+def compute_recipe_scores(now):
+    """Return dicts recipe id -> score for 'popular' and 'trending'."""
+    popular, trending = defaultdict(float), defaultdict(float)
+    trending_start = now - timedelta(
+        days=settings.RECIPE_TRENDING_WINDOW_DAYS
+    )
+    for model, weight in (
+        (FavourRecipe, settings.RECIPE_SCORE_FAVORITE_WEIGHT),
+        (Basket, settings.RECIPE_SCORE_BASKET_WEIGHT),
+    ):
+        add_decayed_counts(
+            popular, model.objects.filter(created__lte=now),
+            TruncDay, timedelta(days=1),
+            weight, settings.RECIPE_POPULAR_HALF_LIFE_DAYS, now
+        )
+        add_decayed_counts(
+            trending, model.objects.filter(
+                created__gt=trending_start, created__lte=now
+            ),
+            TruncHour, timedelta(hours=1),
+            weight, settings.RECIPE_TRENDING_HALF_LIFE_DAYS, now
+        )
+    return popular, trending
+
+
+@transaction.atomic
+def update_recipe_scores(now=None):
+    """Replace all recipe scores, return number of scored recipes.
+
+    Recipes without favorites and basket adds get no score row.
+    """
+    now = now or timezone.now()
+    popular, trending = compute_recipe_scores(now)
+    RecipeScore.objects.all().delete()
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(
+                recipe_id=recipe_id, popular=score,
+                trending=trending.get(recipe_id, 0), updated=now
+            )
+            for recipe_id, score in popular.items()
+        ),
+        batch_size=1000,
+    )
+    scores_updated.send(sender=RecipeScore)
+    return len(popular)
@@ -0,0 +1,115 @@
+"""Поддержка материализованных списков покупок (logic.ShoppingListItem).
+
+Добавление и удаление рецепта из корзины меняет строки списка на
+количество продуктов рецепта. Изменение ингредиентов рецепта
+пересчитывает списки пользователей, у которых рецепт в корзине.
+Строки пользователя меняются под блокировкой его записи, чтобы
+параллельные запросы не теряли изменения. Пересчёт по изменениям
+ингредиентов откладывается до конца транзакции и выполняется один раз
+на все затронутые рецепты.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from recipes.models import Component
+from users.models import CustomUser as User
+from .models import Basket, ShoppingListItem
+
+
+def lock_users(user_ids):
+    """Lock users rows until the end of transaction."""
+    list(
+        User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def change_shopping_list(user_id, recipe_id, sign=1):
+    """Add (sign=1) or subtract (sign=-1) recipe components to user's list.
+
+    Constant number of queries regardless of components count.
+    """
+    amounts = dict(
+        Component.objects.filter(recipe_id=recipe_id).values_list(
+            'product_id'
+        ).annotate(total=Sum('amount')).order_by()
+    )
+    if not amounts:
+        return
+    with transaction.atomic():
+        lock_users((user_id,))
+        items = ShoppingListItem.objects.filter(
+            user_id=user_id, product_id__in=amounts
+        )
+        existing = set(items.values_list('product_id', flat=True))
+        if existing:
+            items.update(amount=F('amount') + Case(
+                *(
+                    When(product_id=product_id, then=Value(sign * amount))
+                    for product_id, amount in amounts.items()
+                    if product_id in existing
+                ),
+                default=Value(0),
+            ))
+        if sign > 0:
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id, product_id=product_id, amount=amount
+                )
+                for product_id, amount in amounts.items()
+                if product_id not in existing
+            )
+        else:
+            items.filter(amount__lte=0).delete()
+
+
+def rebuild_shopping_lists(user_ids):
+    """Recompute shopping lists of users from their baskets."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        lock_users(user_ids)
+        totals = Component.objects.filter(
+            recipe__basket_recipes__user__in=user_ids
+        ).values_list(
+            'recipe__basket_recipes__user', 'product'
+        ).annotate(total=Sum('amount')).order_by()
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user_id=user_id, product_id=product_id,
+                             amount=total)
+            for user_id, product_id, total in totals
+        )
+
+
+def rebuild_recipe_shopping_lists(recipe_ids):
+    """Recompute shopping lists of users who have recipes in basket."""
+    rebuild_shopping_lists(
+        Basket.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'user_id', flat=True
+        ).distinct()
+    )
+
+
+def flush_shopping_lists_rebuild():
+    recipe_ids = connection.shopping_lists_recipe_ids
+    connection.shopping_lists_recipe_ids = set()
+    if recipe_ids:
+        rebuild_recipe_shopping_lists(recipe_ids)
+
+
+def schedule_shopping_lists_rebuild(recipe_ids):
+    """Rebuild shopping lists for recipes once, on transaction commit."""
+    if not connection.in_atomic_block:
+        rebuild_recipe_shopping_lists(recipe_ids)
+        return
+    if not hasattr(connection, 'shopping_lists_recipe_ids'):
+        connection.shopping_lists_recipe_ids = set()
+    connection.shopping_lists_recipe_ids.update(recipe_ids)
+    # колбэк регистрируется при каждом вызове, так он переживает откат
+    # точки сохранения; первый выполненный забирает весь набор, остальные
+    # ничего не делают. Рецепты из откаченной транзакции пересчитываются
+    # со следующей, это безвредно
+    transaction.on_commit(flush_shopping_lists_rebuild)
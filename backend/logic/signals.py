@@ -0,0 +1,116 @@
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.models import Component, Recipe
+from recipes.signals import components_changed, recipes_imported
+from users.models import CustomUser as User
+from .counters import change_counters
+from .feed import follow_author, schedule_fan_out, unfollow_author
+from .models import Basket, FavourRecipe, Follow
+from .shopping_list import (
+    change_shopping_list, rebuild_shopping_lists,
+    schedule_shopping_lists_rebuild,
+)
+
+
+@receiver(post_save, sender=Basket)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        change_shopping_list(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=Basket)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    change_shopping_list(instance.user_id, instance.recipe_id, sign=-1)
+
+
+@receiver(components_changed, sender=Component)
+def update_shopping_lists(sender, recipe_ids, created, **kwargs):
+    # нового рецепта ещё нет в корзинах
+    if not created:
+        schedule_shopping_lists_rebuild(recipe_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_buyers(sender, instance, **kwargs):
+    # каскадное удаление корзин и ингредиентов идёт в произвольном
+    # порядке, списки покупателей пересчитываются после удаления рецепта
+    instance.buyer_ids = list(
+        instance.basket_recipes.values_list('user_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def update_buyers_shopping_lists(sender, instance, **kwargs):
+    rebuild_shopping_lists(getattr(instance, 'buyer_ids', ()))
+
+
+def get_counter_delta(signal, created=False, **kwargs):
+    """Return 1 for created row, -1 for deleted one, 0 for updated."""
+    if signal is post_delete:
+        return -1
+    return 1 if created else 0
+
+
+@receiver(post_save, sender=FavourRecipe)
+@receiver(post_delete, sender=FavourRecipe)
+def count_favorites(sender, instance, **kwargs):
+    delta = get_counter_delta(**kwargs)
+    if delta:
+        change_counters(Recipe, instance.recipe_id, favorites_count=delta)
+
+
+@receiver(post_save, sender=Basket)
+@receiver(post_delete, sender=Basket)
+def count_basket_adds(sender, instance, **kwargs):
+    delta = get_counter_delta(**kwargs)
+    if delta:
+        change_counters(Recipe, instance.recipe_id, basket_count=delta)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_follows(sender, instance, **kwargs):
+    delta = get_counter_delta(**kwargs)
+    if delta:
+        change_counters(User, instance.author_id, followers_count=delta)
+        change_counters(User, instance.user_id, following_count=delta)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def count_recipes(sender, instance, **kwargs):
+    delta = get_counter_delta(**kwargs)
+    if delta:
+        change_counters(User, instance.author_id, recipes_count=delta)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        schedule_fan_out((instance.id,))
+
+
+@receiver(post_save, sender=Follow)
+def fill_follower_feed(sender, instance, created, **kwargs):
+    # счётчик подписчиков автора уже изменён в count_follows
+    if created:
+        follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_follower_feed(sender, instance, **kwargs):
+    # удаление идёт в транзакции, счётчик уже уменьшен в count_follows
+    unfollow_author(instance.user_id, instance.author_id)
+
+
+@receiver(recipes_imported, sender=Recipe)
+def process_imported_recipes(sender, recipe_ids, **kwargs):
+    # bulk_create не посылает post_save: счётчики и ленты здесь
+    authors = Recipe.objects.filter(pk__in=recipe_ids).values(
+        'author_id'
+    ).annotate(total=Count('pk')).order_by()
+    for row in authors:
+        change_counters(User, row['author_id'], recipes_count=row['total'])
+    schedule_fan_out(recipe_ids)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from foodgram_backend.admin import ChangedFieldsAdminMixin
 from .models import Component, Product, Recipe, Tag
 
 
@@ -25,7 +26,7 @@ class ComponentRecipeInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ChangedFieldsAdminMixin, admin.ModelAdmin):
     inlines = (ComponentRecipeInline,)
     readonly_fields = ('pub_date', 'in_favor_count', )
     fields = (
@@ -34,6 +35,7 @@ class RecipeAdmin(admin.ModelAdmin):
     )
 
     list_display = ('title', 'author', 'in_favor_count')
+    list_select_related = ('author',)
     list_display_links = ('title',)
     list_filter = ('author', 'title', 'tags')
     search_fields = ('title', 'author', 'tags',)
@@ -0,0 +1,61 @@
+"""Массовое создание рецептов в обход API и сигналов моделей.
+
+Используется командами import_recipes и generate_fixtures. Вместо
+post_save посылаются сигналы components_changed (индекс подбора
+рецептов) и recipes_imported (счётчики, ленты подписок, поисковые
+векторы, кеш ответов).
+"""
+from django.db import connection, transaction
+
+from .models import Component, Recipe
+from .signals import components_changed, recipes_imported
+
+
+@transaction.atomic
+def bulk_create_recipes(items):
+    """Insert recipes with components and tags, return their ids.
+
+    items - (unsaved recipe with picture set, tag ids,
+    [(product id, amount)]). pub_date of recipes is kept. Costs a fixed
+    number of queries regardless of the number of recipes.
+    """
+    recipes = [recipe for recipe, _, _ in items]
+    pub_dates = [recipe.pub_date for recipe in recipes]
+    Recipe.objects.bulk_create(recipes, batch_size=1000)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # Django 3.2 возвращает id из bulk_create только на PostgreSQL.
+        # SQLite назначает id по возрастанию без повторов (AUTOINCREMENT)
+        # и до конца транзакции не пускает другие записи, поэтому
+        # последние id - только что вставленные рецепты
+        recipe_ids = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[:len(recipes)]
+        for recipe, recipe_id in zip(recipes, reversed(list(recipe_ids))):
+            recipe.id = recipe_id
+    # auto_now_add перезаписывает pub_date при вставке
+    for recipe, pub_date in zip(recipes, pub_dates):
+        recipe.pub_date = pub_date
+    Recipe.objects.bulk_update(recipes, ('pub_date',), batch_size=1000)
+    Component.objects.bulk_create(
+        (
+            Component(recipe_id=recipe.id, product_id=product_id,
+                      amount=amount)
+            for recipe, _, components in items
+            for product_id, amount in components
+        ),
+        batch_size=1000,
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, tag_ids, _ in items
+            for tag_id in tag_ids
+        ),
+        batch_size=1000,
+    )
+    recipe_ids = [recipe.id for recipe in recipes]
+    components_changed.send(
+        sender=Component, recipe_ids=recipe_ids, created=True
+    )
+    recipes_imported.send(sender=Recipe, recipe_ids=recipe_ids)
+    return recipe_ids
@@ -0,0 +1,189 @@
+"""Уменьшенные копии картинок рецептов.
+
+После коммита записи рецепта его картинка в фоновом потоке
+(RECIPE_IMAGE_WORKERS потоков на процесс) уменьшается до вариантов
+VARIANTS в форматах WebP (если Pillow собран с ним) и JPEG. Копии
+лежат рядом по пути, однозначно выводимому из имени оригинала, поэтому
+их URL строятся без запросов к БД. Recipe.processed_picture хранит имя
+картинки, для которой копии готовы; пока оно не совпадает с picture,
+API отдаёт только оригинал.
+Одинаковые картинки хранятся одним файлом (recipes.storage), копии для
+него делаются один раз.
+Задачи очереди живут в памяти процесса, рецепты без копий после
+перезапуска обрабатывает команда generate_image_variants.
+"""
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+# вариант: (ширина, высота, обрезать до пропорций)
+VARIANTS = {
+    'thumbnail': (240, 240, True),
+    'card': (640, 480, True),
+    'full': (1600, 1600, False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+
+executor = None
+executor_lock = Lock()
+
+# Копии картинок рецептов готовы, processed_picture записано.
+# Аргументы: recipe_ids - id рецептов.
+images_processed = Signal()
+
+
+def get_formats():
+    """Return output formats supported by installed Pillow."""
+    return [
+        image_format for image_format in FORMATS
+        if image_format != 'webp' or features.check('webp')
+    ]
+
+
+def get_variant_name(picture_name, variant, image_format):
+    """Return storage name of variant, derived from picture name only."""
+    return posixpath.join(
+        VARIANTS_DIR, picture_name, f'{variant}.{image_format}'
+    )
+
+
+def get_variant_names(picture_name):
+    """Return {variant: {format: storage name}}."""
+    return {
+        variant: {
+            image_format: get_variant_name(picture_name, variant, image_format)
+            for image_format in get_formats()
+        }
+        for variant in VARIANTS
+    }
+
+
+def resize(image, width, height, crop):
+    """Shrink image to fit into width x height, never enlarge."""
+    if crop:
+        scale = min(1, image.width / width, image.height / height)
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def to_rgb(image):
+    """Flatten transparency on white background, JPEG has no alpha."""
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(picture_name):
+    """Write all variants of picture to storage, replacing old ones."""
+    with Recipe.picture.field.storage.open(picture_name) as file:
+        image = Image.open(file)
+        image = to_rgb(ImageOps.exif_transpose(image))
+    for variant, (width, height, crop) in VARIANTS.items():
+        resized = resize(image, width, height, crop)
+        for image_format, (pillow_format, options) in FORMATS.items():
+            if image_format not in get_formats():
+                continue
+            buffer = io.BytesIO()
+            resized.save(
+                buffer, pillow_format,
+                quality=settings.RECIPE_IMAGE_QUALITY, **options
+            )
+            name = get_variant_name(picture_name, variant, image_format)
+            # storage не перезаписывает файлы, а выбирает новое имя
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_images(recipe_ids=None):
+    """Generate variants of recipes without them, return number of images.
+
+    recipe_ids=None - all recipes. Failed images are logged and skipped.
+    """
+    recipes = Recipe.objects.exclude(picture='').exclude(
+        processed_picture=F('picture')
+    )
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    pictures = {}
+    for recipe_id, picture in recipes.values_list('id', 'picture'):
+        pictures.setdefault(picture, []).append(recipe_id)
+    # копии файла, который уже есть у другого рецепта, готовы
+    ready = Recipe.objects.exclude(processed_picture='')
+    if recipe_ids is not None:
+        ready = ready.filter(processed_picture__in=pictures)
+    ready = set(
+        ready.values_list('processed_picture', flat=True).distinct()
+    )
+    processed = 0
+    for picture, ids in pictures.items():
+        if picture not in ready:
+            try:
+                generate_variants(picture)
+            except Exception:
+                logger.exception('Ошибка обработки картинки %s', picture)
+                continue
+        # картинка могла смениться, пока копии готовились
+        Recipe.objects.filter(pk__in=ids, picture=picture).update(
+            processed_picture=picture
+        )
+        images_processed.send(sender=Recipe, recipe_ids=ids)
+        processed += 1
+    return processed
+
+
+def run_in_background(recipe_ids):
+    try:
+        process_recipe_images(recipe_ids)
+    finally:
+        # поток держит свои соединения с БД
+        connections.close_all()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return executor
+
+
+def schedule_images_processing(recipe_ids):
+    """Process images of recipes in background after commit.
+
+    RECIPE_IMAGE_WORKERS=0 - in the committing thread.
+    """
+    recipe_ids = list(recipe_ids)
+    if settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_background, recipe_ids)
+        )
+    else:
+        transaction.on_commit(lambda: process_recipe_images(recipe_ids))
@@ -0,0 +1,98 @@
+import os
+import posixpath
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIR
+from recipes.models import Recipe
+
+
+def walk(storage, directory):
+    """Yield names of all files under directory of storage."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def remove_empty_directories(storage, directories, root):
+    """Remove empty directories up to root, only for local storage."""
+    for directory in sorted(directories, key=len, reverse=True):
+        while directory not in ('', root):
+            try:
+                os.rmdir(storage.path(directory))
+            except NotImplementedError:
+                return
+            except OSError:
+                break
+            directory = posixpath.dirname(directory)
+
+
+class Command(BaseCommand):
+    help = ('Delete recipe images and their resized copies which are not '
+            'used by any recipe. Files younger than --min-age hours are '
+            'kept: they may belong to a recipe being saved right now')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print files to delete',
+        )
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError('Ошибка: --min-age не может быть меньше нуля.')
+        start = perf_counter()
+        self.deadline = timezone.now() - timedelta(hours=options['min_age'])
+        self.dry_run = options['dry_run']
+        self.deleted = self.size = 0
+        used = set(
+            Recipe.objects.exclude(picture='').values_list(
+                'picture', flat=True
+            ).distinct()
+        )
+        storage = Recipe.picture.field.storage
+        pictures_dir = Recipe.picture.field.upload_to.strip('/')
+        self.clean(storage, pictures_dir, used.__contains__)
+        self.clean(
+            default_storage, VARIANTS_DIR,
+            # копии лежат в VARIANTS_DIR/<имя картинки>/
+            lambda name: posixpath.relpath(
+                posixpath.dirname(name), VARIANTS_DIR
+            ) in used,
+        )
+        self.stdout.write(
+            f'{"Будет удалено" if self.dry_run else "Удалено"} файлов: '
+            f'{self.deleted}, {self.size / (1024 * 1024):.1f} МБ '
+            f'за {perf_counter() - start:.2f} с.'
+        )
+
+    def clean(self, storage, root, is_used):
+        """Delete old unused files under root of storage."""
+        directories = set()
+        for name in walk(storage, root):
+            if is_used(name) or not self.is_old(storage, name):
+                continue
+            size = storage.size(name)
+            if self.dry_run:
+                self.stdout.write(name)
+            # загрузка той же картинки могла обновить дату изменения
+            elif self.is_old(storage, name):
+                storage.delete(name)
+                directories.add(posixpath.dirname(name))
+            else:
+                continue
+            self.size += size
+            self.deleted += 1
+        remove_empty_directories(storage, directories, root)
+
+    def is_old(self, storage, name):
+        return storage.get_modified_time(name) <= self.deadline
@@ -0,0 +1,102 @@
+import json
+import sys
+from base64 import b64encode
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Component, Product, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Export recipes with ingredients, tags and images to JSON Lines, '
+            'one recipe per line, see import_recipes for the format')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help='Output file, "-" for stdout',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Recipes loaded per 3 queries',
+        )
+        parser.add_argument(
+            '--no-images', action='store_true',
+            help='Export only image names in storage, without content',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        start = perf_counter()
+        if options['output'] == '-':
+            exported = self.export(sys.stdout, options)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                exported = self.export(output, options)
+        self.stderr.write(
+            f'Выгружено рецептов: {exported} '
+            f'за {perf_counter() - start:.2f} с.'
+        )
+
+    def export(self, output, options):
+        """Write recipes by batches ordered by id, return their number."""
+        tags = dict(Tag.objects.values_list('id', 'slug'))
+        products = {
+            product_id: (name, measurement_unit)
+            for product_id, name, measurement_unit
+            in Product.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        storage = Recipe.picture.field.storage
+        exported, last_id = 0, 0
+        while True:
+            recipes = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk').values(
+                    'id', 'author__email', 'title', 'text', 'cooking_time',
+                    'pub_date', 'picture'
+                )[:options['batch_size']]
+            )
+            if not recipes:
+                return exported
+            recipe_ids = [recipe['id'] for recipe in recipes]
+            recipe_tags, components = {}, {}
+            for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'tag_id'):
+                recipe_tags.setdefault(recipe_id, []).append(tags[tag_id])
+            for recipe_id, product_id, amount in Component.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by('id').values_list('recipe_id', 'product_id', 'amount'):
+                name, measurement_unit = products[product_id]
+                components.setdefault(recipe_id, []).append({
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                    'amount': amount,
+                })
+            for recipe in recipes:
+                item = {
+                    'author': recipe['author__email'],
+                    'name': recipe['title'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'pub_date': recipe['pub_date'].isoformat(),
+                    'tags': recipe_tags.get(recipe['id'], []),
+                    'ingredients': components.get(recipe['id'], []),
+                    'image': recipe['picture'],
+                }
+                if not options['no_images'] and recipe['picture']:
+                    try:
+                        with storage.open(recipe['picture']) as image:
+                            item['image_data'] = b64encode(
+                                image.read()
+                            ).decode()
+                    except FileNotFoundError:
+                        # рецепт выгружается с одним именем картинки
+                        self.stderr.write(
+                            f'Рецепт {recipe["id"]}: нет файла картинки '
+                            f'{recipe["picture"]}'
+                        )
+                output.write(json.dumps(item, ensure_ascii=False) + '\n')
+            exported += len(recipes)
+            last_id = recipe_ids[-1]
@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Make resized copies of recipe images which have none, e.g. '
+            'after deploy or restart with unprocessed background queue')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Remake copies of all images, e.g. after changing sizes',
+        )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        if options['force']:
+            Recipe.objects.update(processed_picture='')
+        processed = process_recipe_images()
+        self.stdout.write(
+            f'Обработано картинок: {processed} '
+            f'за {perf_counter() - start:.2f} с.'
+        )
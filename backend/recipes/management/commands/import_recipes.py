@@ -0,0 +1,215 @@
+import json
+import sys
+from base64 import b64decode
+from binascii import Error as Base64Error
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.bulk import bulk_create_recipes
+from recipes.models import Component, Product, Recipe, Tag
+from users.models import CustomUser as User
+
+RECIPE_FIELDS = {
+    field: Recipe._meta.get_field(field)
+    for field in ('title', 'text', 'cooking_time')
+}
+
+
+class LineError(ValueError):
+    pass
+
+
+def save_files(storage, files):
+    for name, content in files.items():
+        storage.save(name, content)
+
+
+def read_lines(file):
+    """Yield (line number, dict) from JSON Lines, skip empty lines."""
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as error:
+            yield number, LineError(f'невалидный JSON: {error}')
+            continue
+        if not isinstance(item, dict):
+            yield number, LineError('ожидается объект')
+            continue
+        yield number, item
+
+
+class Command(BaseCommand):
+    help = ('Import recipes from JSON Lines written by export_recipes. '
+            'Authors, tags and ingredients must exist, recipes with the same '
+            'author, name and pub_date are skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', nargs='?', default='-',
+            help='Input file, "-" for stdin',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Recipes per transaction',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        start = perf_counter()
+        self.load_maps()
+        self.imported = self.skipped = 0
+        if options['input'] == '-':
+            self.load(sys.stdin, options['batch_size'])
+        else:
+            try:
+                with open(options['input'], encoding='utf-8') as file:
+                    self.load(file, options['batch_size'])
+            except OSError as error:
+                raise CommandError(f'{options["input"]}: {error}')
+        self.stdout.write(
+            f'Загружено рецептов: {self.imported}, '
+            f'пропущено: {self.skipped} '
+            f'за {perf_counter() - start:.2f} с.'
+        )
+
+    def load_maps(self):
+        """Load natural keys -> ids of all referenced tables once."""
+        self.users = dict(User.objects.values_list('email', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.products = {
+            (name, measurement_unit): product_id
+            for product_id, name, measurement_unit
+            in Product.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        self.existing = set(
+            Recipe.objects.values_list('author_id', 'title', 'pub_date')
+        )
+
+    def load(self, file, batch_size):
+        lines = read_lines(file)
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                return
+            recipes = []
+            for number, item in batch:
+                try:
+                    if isinstance(item, LineError):
+                        raise item
+                    recipe = self.clean(item)
+                except LineError as error:
+                    self.stderr.write(f'Строка {number}: {error}')
+                    self.skipped += 1
+                    continue
+                key = (recipe[0].author_id, recipe[0].title,
+                       recipe[0].pub_date)
+                if key in self.existing:
+                    self.skipped += 1
+                    continue
+                self.existing.add(key)
+                recipes.append(recipe)
+            if recipes:
+                self.save_batch(recipes)
+                self.imported += len(recipes)
+
+    def clean(self, item):
+        """Return (unsaved recipe, tag ids, [(product id, amount)], image).
+
+        Raise LineError on invalid data or unknown references.
+        """
+        values = {
+            'title': item.get('name'),
+            'text': item.get('text'),
+            'cooking_time': item.get('cooking_time'),
+        }
+        for name, field in RECIPE_FIELDS.items():
+            try:
+                values[name] = field.clean(values[name], None)
+            except ValidationError as error:
+                raise LineError(f'{name}: {"; ".join(error.messages)}')
+        author_id = self.users.get(item.get('author'))
+        if author_id is None:
+            raise LineError(f'неизвестный автор {item.get("author")}')
+        try:
+            pub_date = datetime.fromisoformat(item['pub_date'])
+        except (KeyError, TypeError, ValueError):
+            raise LineError('pub_date: ожидается дата в формате ISO 8601')
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date)
+        try:
+            tag_ids = {self.tags[slug] for slug in item.get('tags') or ()}
+        except (KeyError, TypeError):
+            raise LineError(f'неизвестный тег в {item.get("tags")}')
+        components = self.clean_components(item.get('ingredients'))
+        image = self.clean_image(item.get('image'), item.get('image_data'))
+        recipe = Recipe(author_id=author_id, pub_date=pub_date, **values)
+        return recipe, tag_ids, components, image
+
+    def clean_components(self, ingredients):
+        """Return [(product id, amount)], repeated products are summed."""
+        components = {}
+        for ingredient in ingredients or ():
+            try:
+                product_id = self.products[(
+                    ingredient['name'], ingredient['measurement_unit']
+                )]
+                amount = Component._meta.get_field('amount').clean(
+                    ingredient['amount'], None
+                )
+            except (KeyError, TypeError):
+                raise LineError(f'неизвестный ингредиент {ingredient}')
+            except ValidationError as error:
+                raise LineError(f'amount: {"; ".join(error.messages)}')
+            components[product_id] = components.get(product_id, 0) + amount
+        if not components:
+            raise LineError('нет ингредиентов')
+        return list(components.items())
+
+    def clean_image(self, name, data):
+        """Return ContentFile of embedded image or name in storage."""
+        name = name or ''
+        if data:
+            try:
+                return ContentFile(
+                    b64decode(data, validate=True),
+                    name=name.rsplit('/', 1)[-1] or 'image'
+                )
+            except (Base64Error, TypeError, ValueError):
+                raise LineError('image_data: невалидный base64')
+        if not name:
+            raise LineError('нет картинки')
+        return name
+
+    @transaction.atomic
+    def save_batch(self, recipes):
+        """Insert recipes, write their embedded images after commit.
+
+        Image names are hashes of content (recipes.storage) and are known
+        before writing, a failed batch leaves no files behind.
+        """
+        field = Recipe.picture.field
+        items, files = [], {}
+        for recipe, tag_ids, components, image in recipes:
+            if isinstance(image, ContentFile):
+                name = field.storage.get_content_name(
+                    field.generate_filename(recipe, image.name), image
+                )
+                files[name] = image
+                image = name
+            recipe.picture = image
+            items.append((recipe, tag_ids, components))
+        # колбэк регистрируется раньше обработки картинок в
+        # recipes_imported и выполняется раньше неё
+        if files:
+            transaction.on_commit(lambda: save_files(field.storage, files))
+        bulk_create_recipes(items)
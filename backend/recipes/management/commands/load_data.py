@@ -1,36 +1,185 @@
 import csv
+import io
+import json
+import os
+from itertools import islice
+from time import perf_counter
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from pytils.translit import slugify
 
 from recipes.models import Product, Tag
+from recipes.signals import products_loaded
+
+DATA_DIR = './recipes/data'
+# модель, поля в порядке столбцов файла, поля уникального ключа
+TAGS = (Tag, ('name', 'color', 'slug'), ('name',))
+PRODUCTS = (
+    Product, ('name', 'measurement_unit'), ('name', 'measurement_unit')
+)
+
+
+def read_rows(path, fields):
+    """Yield (line, values) from headerless .csv or list of dicts .json."""
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.json'):
+            for line, item in enumerate(json.load(file), 1):
+                yield line, [item.get(field) for field in fields]
+        else:
+            for line, row in enumerate(csv.reader(file), 1):
+                if row:
+                    yield line, row
+
+
+def clean_rows(path, model, fields, key_fields):
+    """Return list of valid unique rows as dicts, first duplicate wins."""
+    rows, keys = [], set()
+    for line, values in read_rows(path, fields):
+        if len(values) != len(fields):
+            raise CommandError(
+                f'{path}:{line}: ожидается полей {len(fields)}: '
+                f'{", ".join(fields)}'
+            )
+        row = dict(zip(fields, (str(value or '').strip() for value in values)))
+        if model is Tag and not row['slug']:
+            row['slug'] = slugify(row['name'])[:20]
+        for field in fields:
+            max_length = model._meta.get_field(field).max_length
+            if not row[field] or len(row[field]) > max_length:
+                raise CommandError(
+                    f'{path}:{line}: поле {field} пустое '
+                    f'или длиннее {max_length}'
+                )
+        key = tuple(row[field] for field in key_fields)
+        if key not in keys:
+            keys.add(key)
+            rows.append(row)
+    return rows
+
+
+def count_new(model, rows, key_fields):
+    existing = set(model.objects.values_list(*key_fields))
+    return sum(
+        tuple(row[field] for field in key_fields) not in existing
+        for row in rows
+    )
+
+
+def bulk_insert(model, rows, batch_size):
+    """Insert rows skipping existing ones, return number of inserted."""
+    before = model.objects.count()
+    objects = (model(**row) for row in rows)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            break
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+    return model.objects.count() - before
+
+
+def copy_insert(model, rows, fields):
+    """Insert rows by COPY to temporary table and INSERT ON CONFLICT.
+
+    PostgreSQL only. Return number of inserted rows.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    temp_table = quote(f'load_{model._meta.db_table}')
+    columns = ', '.join(
+        quote(model._meta.get_field(field).column) for field in fields
+    )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [row[field] for field in fields] for row in rows
+    )
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {temp_table} ON COMMIT DROP AS '
+            f'SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        cursor.copy_expert(
+            f'COPY {temp_table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {temp_table} ON CONFLICT DO NOTHING'
+        )
+        return cursor.rowcount
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients data to DB'
+    help = ('Load tags and ingredients data to DB. Existing rows are kept, '
+            'so the command may be run repeatedly')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tags', default=os.path.join(DATA_DIR, 'tags.csv'),
+            help='Tags file: .csv (name,color,slug) or .json',
+        )
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='Ingredients file: .csv (name,measurement_unit) or .json',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per INSERT when COPY is not used',
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk INSERT instead of COPY on PostgreSQL',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate files and count new rows without writing',
+        )
 
     def handle(self, *args, **options):
-        print('Обработка файла tags.csv')
-        with open('./recipes/data/tags.csv', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            count = 0
-            for row in reader:
-                name, color, slug = row
-                Tag.objects.get_or_create(
-                    name=name,
-                    color=color,
-                    slug=slug
-                )
-                count += 1
-                print(f'Обработано: {count} записей.')
-
-        print('Обработка файла ingredients.csv')
-        with open('./recipes/data/ingredients.csv', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            count = 0
-            for row in reader:
-                name, unit = row
-                Product.objects.get_or_create(name=name, measurement_unit=unit)
-                count += 1
-                if not count % 100:
-                    print(f'Обработано: {count} записей.')
-        print(f'Всего обработано: {count} записей.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        start = perf_counter()
+        # все файлы проверяются до записи
+        loads = []
+        for path, (model, fields, key_fields) in (
+            (options['tags'], TAGS),
+            (options['ingredients'], PRODUCTS),
+        ):
+            try:
+                rows = clean_rows(path, model, fields, key_fields)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'{path}: {error}')
+            loads.append((path, model, fields, key_fields, rows))
+        self.stdout.write(
+            f'Файлы прочитаны за {perf_counter() - start:.2f} с.'
+        )
+
+        created_products = 0
+        for path, model, fields, key_fields, rows in loads:
+            file_start = perf_counter()
+            if options['dry_run']:
+                created = count_new(model, rows, key_fields)
+            else:
+                with transaction.atomic():
+                    if use_copy:
+                        created = copy_insert(model, rows, fields)
+                    else:
+                        created = bulk_insert(
+                            model, rows, options['batch_size']
+                        )
+            if model is Product:
+                created_products = created
+            action = 'будет добавлено' if options['dry_run'] else 'добавлено'
+            self.stdout.write(
+                f'{path}: записей {len(rows)}, {action} {created} '
+                f'за {perf_counter() - file_start:.2f} с.'
+            )
+        # bulk_create и COPY не посылают сигналы моделей
+        if created_products and not options['dry_run']:
+            products_loaded.send(sender=Product)
+        self.stdout.write(f'Всего за {perf_counter() - start:.2f} с.')
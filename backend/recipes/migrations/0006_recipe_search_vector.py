@@ -0,0 +1,57 @@
+# Generated by Django 3.2.8 on 2026-10-18 01:38
+
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField
+
+# полнотекстовый поиск есть только на PostgreSQL, на других СУБД поле
+# остаётся пустым, а индекс не создаётся
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Component = apps.get_model('recipes', 'Component')
+    products = Component.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('product__name', delimiter=' ')
+    ).values('names')
+    Recipe.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='russian')
+        + SearchVector(
+            Subquery(products, output_field=TextField()),
+            weight='B', config='russian'
+        )
+        + SearchVector('text', weight='C', config='russian')
+    ))
+    schema_editor.execute(
+        f'CREATE INDEX {INDEX_NAME} ON {Recipe._meta.db_table} '
+        f'USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
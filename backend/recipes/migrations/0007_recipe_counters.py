@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='basket_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлен в корзину раз'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлен в избранное раз'),
+        ),
+    ]
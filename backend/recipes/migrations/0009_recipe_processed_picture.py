@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='processed_picture',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка с готовыми уменьшенными копиями'),
+        ),
+    ]
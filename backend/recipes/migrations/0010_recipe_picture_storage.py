@@ -0,0 +1,19 @@
+# Generated by Django 3.2.8 on 2026-10-18 02:05
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_processed_picture'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='picture',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='Картинка готового блюда'),
+        ),
+    ]
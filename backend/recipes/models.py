@@ -1,9 +1,12 @@
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 from pytils.translit import slugify
 
+from .storage import ContentAddressedStorage
+
 User = settings.AUTH_USER_MODEL
 
 MIN_AMOUNT_VALUE = 1
@@ -134,12 +137,20 @@ class Recipe(models.Model):
     Поля:
     author - Автор публикации.
     title - Название блюда.
-    picture - Картинка.
+    picture - Картинка, имя файла - хеш содержимого (recipes.storage).
     text - Описание процесса приготовления.
     components - Ингредиенты, выбор из существующих + ед. измерения и кол-во.
     tag - Тег, один или несколько.
     cooking_time - Время на приготовление в минутах.
     pub_date - Дата публикации.
+    search_vector - Поисковый вектор, заполняется recipes.search.
+    favorites_count, basket_count - Счётчики добавлений в избранное
+    и в корзину, меняются только через F() из logic.counters.
+    processed_picture - Имя картинки, для которой готовы уменьшенные
+    копии, пишется recipes.images.
+    Эти поля пишутся в обход save(), полное сохранение рецепта затрёт
+    их значениями на момент загрузки, поэтому API и админка сохраняют
+    только изменённые поля (update_fields).
     Related_names:
     'basket_recipes'        from logic.Basket
     'favourite'             from logic.FavourRecipe
@@ -154,7 +165,7 @@ class Recipe(models.Model):
         verbose_name='Название рецепта'
     )
     picture = models.ImageField(
-        upload_to='recipes/',
+        upload_to='recipes/', storage=ContentAddressedStorage(),
         verbose_name='Картинка готового блюда'
     )
     text = models.TextField(
@@ -186,9 +197,36 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    search_vector = SearchVectorField(
+        null=True, editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлен в избранное раз'
+    )
+    basket_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлен в корзину раз'
+    )
+    processed_picture = models.CharField(
+        max_length=100, blank=True, editable=False,
+        verbose_name='Картинка с готовыми уменьшенными копиями'
+    )
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        # ключ постраничной выдачи ленты курсором
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            # рецепты популярных авторов в лентах подписок
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -202,6 +240,6 @@ class Recipe(models.Model):
     def in_favor_count(self):
         """Вернуть сколько раз рецепт добавлен в избранное пользователями.
 
-        relation from logic:FavourRecipes.recipes m2m
+        Счётчик поддерживается logic.counters.
         """
-        return self.favourite.count()
+        return self.favorites_count
@@ -0,0 +1,98 @@
+"""Полнотекстовый поиск рецептов.
+
+На PostgreSQL рецепты ищутся по полю Recipe.search_vector с GIN-индексом,
+с русской морфологией. Веса: название - A, ингредиенты - B,
+описание - C. Вектор пересчитывается после записи рецепта,
+его ингредиентов или переименования продукта, один раз на рецепт
+в конце транзакции.
+На других СУБД (SQLite в тестах) поиск сводится к icontains по тем же
+полям, без ранжирования.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, TextField
+
+from .models import Component, Recipe
+
+SEARCH_CONFIG = 'russian'
+SEARCH_FIELDS = frozenset(('title', 'text'))
+
+
+def is_full_text_search_supported():
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector():
+    """Return expression of recipe's search vector for update()."""
+    products = Component.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('product__name', delimiter=' ')
+    ).values('names')
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(products, output_field=TextField()),
+            weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """Recompute search vectors of recipes by one UPDATE."""
+    if not is_full_text_search_supported():
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=get_search_vector()
+    )
+
+
+def flush_search_vectors_update():
+    recipe_ids = connection.search_vectors_recipe_ids
+    connection.search_vectors_recipe_ids = set()
+    if recipe_ids:
+        update_search_vectors(recipe_ids)
+
+
+def schedule_search_vectors_update(recipe_ids):
+    """Update search vectors of recipes once, on transaction commit."""
+    if not is_full_text_search_supported():
+        return
+    if not connection.in_atomic_block:
+        update_search_vectors(recipe_ids)
+        return
+    if not hasattr(connection, 'search_vectors_recipe_ids'):
+        connection.search_vectors_recipe_ids = set()
+    connection.search_vectors_recipe_ids.update(recipe_ids)
+    # как в logic.shopping_list: первый выполненный колбэк обновляет
+    # все рецепты набора, остальные ничего не делают
+    transaction.on_commit(flush_search_vectors_update)
+
+
+def search_recipes(queryset, value):
+    """Filter recipes qs by search string.
+
+    On PostgreSQL the string is parsed as web search query
+    ("фраза", or, -исключить), results are ordered by rank.
+    """
+    value = value.strip()
+    if not value:
+        return queryset
+    if is_full_text_search_supported():
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    return queryset.filter(
+        Q(title__icontains=value)
+        | Q(text__icontains=value)
+        | Q(pk__in=Component.objects.filter(
+            product__name__icontains=value
+        ).values('recipe_id'))
+    )
@@ -0,0 +1,114 @@
+from dataclasses import dataclass, field
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .images import schedule_images_processing
+from .models import Component, Product, Recipe
+from .search import SEARCH_FIELDS, schedule_search_vectors_update
+
+# Рецепт создан или изменён через API.
+# Аргументы: instance - рецепт, created - bool, changes - RecipeChanges.
+# Посылается внутри транзакции записи, после изменения всех данных.
+recipe_changed = Signal()
+
+# Рецепты созданы массово, в обход сигналов моделей (import_recipes).
+# Аргументы: recipe_ids - id созданных рецептов.
+# Посылается внутри транзакции записи, после записи ингредиентов и тегов.
+recipes_imported = Signal()
+
+# Ингредиенты рецептов изменены.
+# Аргументы: recipe_ids - id рецептов, created - рецепты только что
+# созданы. Посылается внутри транзакции записи один раз на все
+# изменённые ингредиенты рецептов.
+components_changed = Signal()
+
+# Продукты созданы массово, в обход сигналов моделей (load_data).
+# Аргументов нет. Посылается после коммита записи.
+products_loaded = Signal()
+
+
+@dataclass
+class RecipeChanges:
+    """Что изменилось в рецепте при записи.
+
+    Поля:
+    fields - изменённые поля модели Recipe.
+    products_added, products_updated, products_removed - id продуктов
+    добавленных, изменённых (количество) и удалённых ингредиентов.
+    tags_added, tags_removed - id тегов.
+    """
+    fields: set = field(default_factory=set)
+    products_added: set = field(default_factory=set)
+    products_updated: set = field(default_factory=set)
+    products_removed: set = field(default_factory=set)
+    tags_added: set = field(default_factory=set)
+    tags_removed: set = field(default_factory=set)
+
+    def __bool__(self):
+        return any((
+            self.fields, self.products_changed,
+            self.tags_added, self.tags_removed,
+        ))
+
+    @property
+    def products_changed(self):
+        return (
+            self.products_added | self.products_updated
+            | self.products_removed
+        )
+
+    @property
+    def tags_changed(self):
+        return self.tags_added | self.tags_removed
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or update_fields is None or SEARCH_FIELDS & update_fields:
+        schedule_search_vectors_update((instance.id,))
+
+
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+def send_component_changed(sender, instance, **kwargs):
+    # ингредиент записан по одному, например в админке
+    components_changed.send(
+        sender=Component, recipe_ids=[instance.recipe_id], created=False
+    )
+
+
+@receiver(components_changed, sender=Component)
+def update_components_recipes_search_vectors(sender, recipe_ids, created,
+                                             **kwargs):
+    # вектор нового рецепта обновляется по post_save и recipes_imported
+    if not created:
+        schedule_search_vectors_update(recipe_ids)
+
+
+@receiver(post_save, sender=Product)
+def update_product_recipes_search_vectors(sender, instance, created,
+                                          update_fields, **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    schedule_search_vectors_update(
+        instance.components.values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(recipes_imported, sender=Recipe)
+def update_imported_recipes_search_vectors(sender, recipe_ids, **kwargs):
+    schedule_search_vectors_update(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_picture(sender, instance, created, update_fields,
+                           **kwargs):
+    if created or update_fields is None or 'picture' in update_fields:
+        schedule_images_processing((instance.id,))
+
+
+@receiver(recipes_imported, sender=Recipe)
+def process_imported_recipes_pictures(sender, recipe_ids, **kwargs):
+    schedule_images_processing(recipe_ids)
@@ -0,0 +1,73 @@
+"""Хранение картинок рецептов по хешу содержимого.
+
+Имя файла - SHA-256 содержимого: одинаковые картинки хранятся один раз,
+а содержимое файла по URL никогда не меняется, поэтому nginx отдаёт их
+с долгим кешированием. Файл может использоваться несколькими рецептами,
+поэтому при удалении или смене картинки рецепта он не удаляется;
+неиспользуемые файлы удаляет команда clean_media.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def get_content_hash(content):
+    """Return SHA-256 hex digest of file content, file is read from start."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage naming files '<dir>/<ab>/<sha256>.<ext>'.
+
+    <dir> is upload_to of the field, <ab> - first two characters of hash,
+    so that a directory does not hold too many files.
+    """
+
+    def get_content_name(self, name, content):
+        """Return name under which content of file name is stored.
+
+        Name which already is the name of content is returned as is.
+        """
+        directory, filename = posixpath.split(name)
+        content_hash = get_content_hash(content)
+        filename = content_hash + os.path.splitext(filename)[1].lower()
+        if posixpath.basename(directory) == content_hash[:2]:
+            directory = posixpath.dirname(directory)
+        return posixpath.join(directory, content_hash[:2], filename)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        try:
+            if not self.exists(name):
+                return super().save(name, content, max_length)
+        except FileExistsError:
+            # ту же картинку одновременно записал другой запрос
+            pass
+        # свежая дата изменения защищает файл от clean_media,
+        # если до загрузки он ни на что не ссылался
+        os.utime(self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        """Raise FileExistsError instead of choosing another name.
+
+        A file with the name has the same content, see save().
+        """
+        if self.exists(name):
+            raise FileExistsError(name)
+        return super().get_available_name(name, max_length)
@@ -0,0 +1,17 @@
+#!/bin/sh
+# Периодические команды контейнера scheduler (remote_srv/docker-compose.yml):
+# рейтинги рецептов пересчитываются каждые SCORES_INTERVAL секунд,
+# счётчики исправляются раз в COUNTERS_INTERVAL секунд.
+SCORES_INTERVAL=${SCORES_INTERVAL:-600}
+COUNTERS_INTERVAL=${COUNTERS_INTERVAL:-86400}
+
+elapsed=$COUNTERS_INTERVAL
+while true; do
+    if [ "$elapsed" -ge "$COUNTERS_INTERVAL" ]; then
+        python manage.py reconcile_counters
+        elapsed=0
+    fi
+    python manage.py update_recipe_scores
+    sleep "$SCORES_INTERVAL"
+    elapsed=$((elapsed + SCORES_INTERVAL))
+done
@@ -19,6 +19,11 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     'follower'          from logic.Follow
     'following'         from logic.Follow
     'favour_recipes'    from logic.FavourRecipe
+    Счётчики followers_count, following_count, recipes_count меняются
+    только через F() из logic.counters. Админка сохраняет только
+    изменённые поля, чтобы не затереть их; расхождения после полного
+    сохранения (например, смены пароля через djoser) исправляет команда
+    reconcile_counters.
     """
     email = models.EmailField(
         unique=True,
@@ -56,6 +61,18 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         default=True,
         verbose_name='Аккаунт разрешён'
     )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Подписан на'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Рецептов'
+    )
 
     USERNAME_FIELD = 'email'
 
@@ -79,9 +96,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def follows(self):
         """Вернуть количество подписок пользователя.
 
-        relation from logic:Follow.user one2many
+        Счётчик поддерживается logic.counters.
         """
-        return self.follower.count()
+        return self.following_count
 
     @property
     def is_not_active(self):